@@ -6,41 +6,448 @@ from flask import (
     redirect,
     url_for,
     jsonify,
+    make_response,
 )
 import os
 import json
 import time
 import random
 import string
+import hashlib
+import shutil
+import tempfile
+import threading
+import functools
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import ClosingIterator
 
-app = Flask(__name__)
+from assets import AssetPipeline
+from cluster import Cluster, ClusterError
+from jobs import JobQueue, JobCancelled, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from preview import LineIndexStore, is_text_file, read_head, read_tail
+from store import SharedStore
+
+# static/ is only served through the asset pipeline, under hashed names
+app = Flask(__name__, static_folder=None)
 
 # Configuration
 UPLOAD_FOLDER = "uploads"
-STATS_FILE = "download_stats.json"
+INCOMING_FOLDER = os.path.join(UPLOAD_FOLDER, ".incoming")  # Uploads in progress
+STATE_DB = "file_share.db"
+STATS_FILE = "download_stats.json"  # Used before STATE_DB, imported on start-up
+HASHES_FILE = "file_hashes.json"  # Used before STATE_DB, imported on start-up
 SPEEDTEST_FOLDER = "speedtest"
+INDEX_FOLDER = "line_indexes"
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["SPEEDTEST_FOLDER"] = SPEEDTEST_FOLDER
 app.config["MAX_CONTENT_LENGTH"] = 500 * 1024 * 1024  # Limit uploads to 500MB
+app.config["JOB_WORKERS"] = 2  # Background threads for post-upload processing
+app.config["JOB_MAX_DEFER"] = 5  # Most seconds a job backs off for transfers at once
+app.config["SHELL_MAX_AGE"] = 300  # Seconds browsers may reuse the page shell
+app.config["PREVIEW_MAX_LINES"] = 1000  # Most lines returned by one preview request
+app.config["PREVIEW_MAX_LINE_BYTES"] = 8 * 1024  # Longer lines are cut short
+app.config["PREVIEW_MAX_BYTES"] = 1024 * 1024  # Most bytes read for one preview
+
+# Cluster mode: NODE_URL is this node's address as other nodes reach it (e.g.
+# http://192.168.1.10:5000) and CLUSTER_NODES a comma-separated list of nodes
+# to join. Leave NODE_URL empty to run on your own.
+app.config["NODE_URL"] = os.environ.get("NODE_URL", "")
+app.config["CLUSTER_NODES"] = [
+    url for url in os.environ.get("CLUSTER_NODES", "").split(",") if url
+]
+app.config["REPLICATION_FACTOR"] = int(os.environ.get("REPLICATION_FACTOR", 2))
+
+# Serve static/ under content-hashed names with long-lived cache headers
+assets = AssetPipeline(app)
 
 # Create necessary directories if they don't exist
-for folder in [UPLOAD_FOLDER, SPEEDTEST_FOLDER]:
-    if not os.path.exists(folder):
-        os.makedirs(folder)
+for folder in [UPLOAD_FOLDER, INCOMING_FOLDER, SPEEDTEST_FOLDER, INDEX_FOLDER]:
+    os.makedirs(folder, exist_ok=True)
+
+# The process umask, applied to uploads by hand since they start as temp files
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+# Download counts, checksums and file generations, shared by all worker processes
+store = SharedStore(STATE_DB)
+store.migrate_json(STATS_FILE, HASHES_FILE)
+
+cluster = None
+if app.config["NODE_URL"]:
+    cluster = Cluster(
+        app.config["NODE_URL"], store, app.config["REPLICATION_FACTOR"]
+    )
+    for url in app.config["CLUSTER_NODES"]:
+        cluster.add_node(url)
+
+
+# Count of uploads/downloads in flight in this process; background jobs back
+# off while > 0
+active_transfers = 0
+transfers_lock = threading.Lock()
+
+
+def begin_transfer():
+    global active_transfers
+    with transfers_lock:
+        active_transfers += 1
+
+
+def end_transfer():
+    global active_transfers
+    with transfers_lock:
+        active_transfers -= 1
+
+
+def transfers_in_progress():
+    return active_transfers > 0
+
+
+job_queue = JobQueue(
+    workers=app.config["JOB_WORKERS"],
+    busy=transfers_in_progress,
+    max_defer=app.config["JOB_MAX_DEFER"],
+)
+
+
+def hash_file_job(job):
+    """Compute the SHA-256 of an uploaded file and record it"""
+    file_path = os.path.join(app.config["UPLOAD_FOLDER"], job.filename)
+    generation = store.generation(job.filename)
+    stat = os.stat(file_path)
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            job.checkpoint()
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+
+    # Another worker may have replaced or deleted the file meanwhile
+    if store.generation(job.filename) != generation:
+        raise JobCancelled()
+    store.set_hash(job.filename, digest.hexdigest(), stat.st_size, stat.st_mtime)
+
+    return {"sha256": digest.hexdigest()}
+
+
+# Sparse line offsets for previewing large text files
+line_indexes = LineIndexStore(INDEX_FOLDER)
+
+
+def index_file_job(job):
+    """Build the line index of an uploaded text file ahead of any preview"""
+    file_path = os.path.join(app.config["UPLOAD_FOLDER"], job.filename)
+    if not is_text_file(file_path):
+        return {"indexed": False}
+
+    index = line_indexes.get(
+        file_path,
+        job.filename,
+        checkpoint=job.checkpoint,
+        generation=store.generation(job.filename),
+    )
+    return {"indexed": True, "lines": index.total_lines}
+
+
+def schedule_post_upload_jobs(filename, place=True):
+    """Queue follow-up processing for a freshly uploaded file. In cluster
+    mode this includes copying it to its owners, unless place is False."""
+    jobs = [
+        job_queue.submit("hash", filename, hash_file_job, PRIORITY_NORMAL),
+        job_queue.submit("index", filename, index_file_job, PRIORITY_LOW),
+    ]
+    if place and cluster is not None:
+        jobs.append(job_queue.submit("place", filename, place_file_job, PRIORITY_HIGH))
+    return jobs
+
+
+def save_local_file(filename, write):
+    """Store a file in the upload folder; write(f) writes its content.
+
+    The content goes to a private temporary file that is synced to disk and
+    then moved into place, so other workers never see it half written.
+    """
+    file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+
+    # Cancel processing of any previous version of this file
+    job_queue.cancel(filename)
+    line_indexes.discard(filename)
+
+    fd, tmp_path = tempfile.mkstemp(dir=INCOMING_FOLDER)
+    try:
+        # mkstemp creates the file 0600; give it the mode open() would have
+        os.fchmod(fd, 0o666 & ~UMASK)
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    store.bump_generation(filename)
+
+    # Initialize download count for new file
+    store.add_file(filename)
+    return file_path
+
+
+def remove_local_file(filename):
+    file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    if not os.path.isfile(file_path):
+        return False
+
+    # Stop any background work on the file before it disappears
+    job_queue.cancel(filename)
+    os.remove(file_path)
+
+    # Remove from stats and tell other workers to drop anything cached
+    store.remove_file(filename)
+    line_indexes.discard(filename)
+    return True
+
 
+def save_request_body(filename):
+    """Store the raw request body as a file, streaming it to disk. An
+    X-File-Mtime header (seconds since the epoch) sets the file's mtime."""
+    begin_transfer()
+    try:
+        file_path = save_local_file(
+            filename, lambda f: shutil.copyfileobj(request.stream, f, 1024 * 1024)
+        )
+    finally:
+        end_transfer()
+
+    mtime = request.headers.get("X-File-Mtime", type=float)
+    if mtime is not None:
+        os.utime(file_path, (mtime, mtime))
+    return file_path
+
+
+def local_file_listing():
+    """[name, size_bytes, downloads] for each file stored on this node"""
+    files = []
+    stats = store.download_stats()
+
+    if os.path.exists(app.config["UPLOAD_FOLDER"]):
+        with os.scandir(app.config["UPLOAD_FOLDER"]) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    files.append(
+                        [entry.name, entry.stat().st_size, stats.get(entry.name, 0)]
+                    )
+
+    files.sort()
+    return files
+
+
+def current_hash(known, stat):
+    """The recorded sha256 if it was taken of the file as it is now, else None"""
+    if (
+        known is not None
+        and known["size"] == stat.st_size
+        and known["mtime"] == stat.st_mtime
+    ):
+        return known["sha256"]
+    return None
+
+
+def local_manifest():
+    """[name, size_bytes, mtime, sha256] for each file stored on this node.
+    sha256 is None until the background hash job has caught up."""
+    manifest = []
+    hashes = store.file_hashes()
+
+    if os.path.exists(app.config["UPLOAD_FOLDER"]):
+        with os.scandir(app.config["UPLOAD_FOLDER"]) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    sha256 = current_hash(hashes.get(entry.name), stat)
+                    manifest.append([entry.name, stat.st_size, stat.st_mtime, sha256])
+
+    manifest.sort()
+    return manifest
+
+
+def place_file(filename, force=False):
+    """Copy a local file to the cluster nodes that should hold it, and drop
+    our own copy if we are not one of them"""
+    file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    stat = os.stat(file_path)
+    sha256 = current_hash(store.file_hash(filename), stat)
+    owners = cluster.owners(filename)
+
+    for node in owners:
+        if node == cluster.node_url:
+            continue
+        info = None if force else cluster.file_info(node, filename)
+        # A copy of the same size may still be stale (e.g. an earlier push
+        # failed), and we may be about to delete ours, so only a matching
+        # checksum counts. Without one on both sides, push to be safe.
+        if (
+            info is None
+            or info["size"] != stat.st_size
+            or sha256 is None
+            or info.get("sha256") != sha256
+        ):
+            cluster.push_file(node, filename, file_path)
+
+    if cluster.node_url not in owners:
+        # Hand our download count over so the cluster-wide total is kept.
+        # Taking it is atomic, so it is only handed over once.
+        downloads = store.take_downloads(filename)
+        if downloads:
+            try:
+                cluster.add_downloads(owners[0], filename, downloads)
+            except ClusterError:
+                store.increment_downloads(filename, downloads)
+                raise
+        remove_local_file(filename)
+
+    return {"owners": owners}
+
+
+def place_file_job(job):
+    """Replicate a freshly uploaded file to its owners"""
+    try:
+        return place_file(job.filename, force=True)
+    except (ClusterError, OSError):
+        # An owner may be down; a later rebalance will try again
+        retry_rebalance_later()
+        raise
+
+
+# Seconds a rebalancing worker may go without renewing its claim before
+# another worker may take over
+REBALANCE_LEASE = 120
+
+
+def rebalance_job(job):
+    """Move every local file to the nodes that own it under the current ring.
+
+    Any worker process may ask for one (see request_rebalance), but only one
+    per node runs at a time.
+    """
+    holder = f"{os.getpid()}:{job.id}"
+    if not store.acquire_lease("rebalance", holder, REBALANCE_LEASE):
+        return {"handed_over": True}
+
+    try:
+        rerun = True
+        while rerun:
+            failed = []
+            files = local_file_listing()
+            for name, _, _ in files:
+                job.checkpoint()
+                store.acquire_lease("rebalance", holder, REBALANCE_LEASE)
+                try:
+                    place_file(name)
+                except (ClusterError, OSError):
+                    failed.append(name)
+            rerun = store.finish_lease("rebalance", holder)
+    except BaseException:
+        store.release_lease("rebalance", holder)
+        raise
+
+    if failed:
+        retry_rebalance_later()
+    else:
+        reset_rebalance_retry()
+    return {"files": len(files), "failed": failed}
+
+
+# Placements that failed, e.g. because an owner was down, are retried by
+# rebalancing again after a delay that doubles up to REBALANCE_RETRY_MAX
+REBALANCE_RETRY_MIN = 10
+REBALANCE_RETRY_MAX = 600
+rebalance_retry_timer = None
+rebalance_retry_delay = REBALANCE_RETRY_MIN
+rebalance_retry_lock = threading.Lock()
+
+
+def retry_rebalance_later():
+    global rebalance_retry_timer, rebalance_retry_delay
+    with rebalance_retry_lock:
+        if rebalance_retry_timer is not None:
+            return
+        rebalance_retry_timer = threading.Timer(rebalance_retry_delay, retry_rebalance)
+        rebalance_retry_timer.daemon = True
+        rebalance_retry_timer.start()
+        rebalance_retry_delay = min(rebalance_retry_delay * 2, REBALANCE_RETRY_MAX)
 
-# Initialize or load download stats
-def get_download_stats():
-    if os.path.exists(STATS_FILE):
-        with open(STATS_FILE, "r") as f:
-            return json.load(f)
-    return {}
 
+def retry_rebalance():
+    global rebalance_retry_timer
+    with rebalance_retry_lock:
+        rebalance_retry_timer = None
+    request_rebalance()
 
-def save_download_stats(stats):
-    with open(STATS_FILE, "w") as f:
-        json.dump(stats, f)
+
+def reset_rebalance_retry():
+    global rebalance_retry_delay
+    with rebalance_retry_lock:
+        rebalance_retry_delay = REBALANCE_RETRY_MIN
+
+
+def request_rebalance():
+    """Have this node's files checked against the current ring"""
+    # A rebalance already running, in this process or another, goes round
+    # again; otherwise the job below starts one
+    store.request_rerun("rebalance")
+    job_queue.submit("rebalance", None, rebalance_job, PRIORITY_LOW, replace=False)
+
+
+def announce_job(job):
+    """Introduce this node to the rest of the cluster, then rebalance"""
+    for node in cluster.peers():
+        try:
+            cluster.announce(node)
+        except ClusterError:
+            pass
+    request_rebalance()
+
+
+cluster_started = False
+cluster_start_lock = threading.Lock()
+
+
+def start_cluster():
+    """Join the cluster in the background. Call it in every process that
+    serves requests once it is running: python app.py does so itself, and
+    gunicorn.conf.py does it for each gunicorn worker."""
+    global cluster_started
+    with cluster_start_lock:
+        if cluster is None or cluster_started:
+            return
+        cluster_started = True
+    job_queue.submit("announce", None, announce_job, PRIORITY_HIGH)
+
+
+def cluster_only(view):
+    """Hide node-to-node endpoints when cluster mode is off"""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if cluster is None:
+            return jsonify({"success": False, "message": "Cluster mode is off"}), 404
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def redirect_to_holder(filename):
+    """In cluster mode, send a request for a file we don't have to a node that
+    has it. Returns None if there is no such node."""
+    if cluster is None:
+        return None
+    node = cluster.locate(filename)
+    if node is None:
+        return None
+    return redirect(node + request.full_path.rstrip("?"))
 
 
 def generate_random_file(size_mb=10):
@@ -60,40 +467,77 @@ def generate_random_file(size_mb=10):
 
 @app.route("/")
 def index():
-    # Get list of files in upload directory
-    files = []
-    stats = get_download_stats()
-
-    if os.path.exists(UPLOAD_FOLDER):
-        for filename in os.listdir(UPLOAD_FOLDER):
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            if os.path.isfile(file_path):
-                # Get file size
-                size_bytes = os.path.getsize(file_path)
-                # Format size
-                if size_bytes < 1024:
-                    size = f"{size_bytes} B"
-                elif size_bytes < 1024 * 1024:
-                    size = f"{size_bytes/1024:.1f} KB"
-                else:
-                    size = f"{size_bytes/(1024*1024):.1f} MB"
-
-                download_count = stats.get(filename, 0)
-
-                files.append(
-                    {
-                        "name": filename,
-                        "size": size,
-                        "size_bytes": size_bytes,
-                        "downloads": download_count,
-                    }
-                )
-
-    return render_template("index.html", files=files)
+    # The page is a static shell; the file list is fetched from /api/files
+    response = make_response(render_template("index.html"))
+    response.headers["Cache-Control"] = f"public, max-age={app.config['SHELL_MAX_AGE']}"
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.route("/api/files")
+def list_files():
+    """Compact file listing: each entry is [name, size_bytes, downloads].
+    In cluster mode this covers the files of every reachable node."""
+    files = local_file_listing()
+    if cluster is not None:
+        files = cluster.merged_listing(files)
+
+    response = app.response_class(
+        json.dumps({"files": files}, separators=(",", ":")),
+        mimetype="application/json",
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.route("/api/manifest")
+def manifest():
+    """Compact manifest for sync clients: each entry is
+    [name, size_bytes, mtime, sha256]. In cluster mode this covers every
+    reachable node unless ?local=1 is given."""
+    entries = local_manifest()
+    if cluster is not None and not request.args.get("local"):
+        entries = cluster.merged_manifest(entries)
+
+    response = app.response_class(
+        json.dumps({"files": entries}, separators=(",", ":")),
+        mimetype="application/json",
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.route("/api/files/<filename>", methods=["PUT"])
+def put_file(filename):
+    """Upload a file as the raw request body, for scripts and the sync client"""
+    filename = secure_filename(filename)
+    if filename == "":
+        return jsonify({"success": False, "message": "Invalid filename"}), 400
+
+    file_path = save_request_body(filename)
+    jobs = schedule_post_upload_jobs(filename)
+    return jsonify(
+        {
+            "success": True,
+            "filename": filename,
+            "size": os.path.getsize(file_path),
+            "jobs": [job.id for job in jobs],
+        }
+    )
 
 
 @app.route("/upload", methods=["POST"])
 def upload_file():
+    begin_transfer()
+    try:
+        return receive_upload()
+    finally:
+        end_transfer()
+
+
+def receive_upload():
     if "file" not in request.files:
         return jsonify({"success": False, "message": "No file part"})
 
@@ -104,11 +548,10 @@ def upload_file():
 
     if file:
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
 
         # Save file
         start_time = time.time()
-        file.save(file_path)
+        file_path = save_local_file(filename, file.save)
         upload_time = time.time() - start_time
 
         # Get file size
@@ -120,11 +563,8 @@ def upload_file():
         else:
             upload_speed = 0
 
-        # Initialize download count for new file
-        stats = get_download_stats()
-        if filename not in stats:
-            stats[filename] = 0
-            save_download_stats(stats)
+        # Hashing etc. runs in the background so the client isn't held up
+        jobs = schedule_post_upload_jobs(filename)
 
         return jsonify(
             {
@@ -133,35 +573,183 @@ def upload_file():
                 "filename": filename,
                 "size": size_bytes,
                 "upload_speed": f"{upload_speed:.2f} MB/s",
+                "jobs": [job.id for job in jobs],
             }
         )
 
 
 @app.route("/download/<filename>")
 def download_file(filename):
+    file_path = safe_join(app.config["UPLOAD_FOLDER"], filename)
+    if file_path is None or not os.path.isfile(file_path):
+        response = redirect_to_holder(filename)
+        if response is not None:
+            return response
+
     # Increment download count
-    stats = get_download_stats()
-    stats[filename] = stats.get(filename, 0) + 1
-    save_download_stats(stats)
+    store.increment_downloads(filename)
 
-    return send_from_directory(
-        app.config["UPLOAD_FOLDER"], filename, as_attachment=True
-    )
+    begin_transfer()
+    try:
+        # Flask resolves relative directories against the app's own folder,
+        # not the working directory the upload folder was created in
+        response = send_from_directory(
+            os.path.abspath(app.config["UPLOAD_FOLDER"]), filename, as_attachment=True
+        )
+    except Exception:
+        end_transfer()
+        raise
+    # The body is streamed after we return, so count it until it is closed
+    response.response = ClosingIterator(response.response, end_transfer)
+    return response
 
 
 @app.route("/delete/<filename>")
 def delete_file(filename):
+    remove_local_file(filename)
+    if cluster is not None:
+        cluster.delete_everywhere(filename)
+
+    return redirect(url_for("index"))
+
+
+@app.route("/preview/<filename>")
+def preview_file(filename):
+    """Return part of a text file without downloading all of it.
+
+    Use ?head=N or ?tail=N for the first/last N lines, or ?start=A&end=B for
+    lines A up to (not including) B, counting from 0.
+    """
+    file_path = safe_join(app.config["UPLOAD_FOLDER"], filename)
+    if file_path is None or not os.path.isfile(file_path):
+        return redirect_to_holder(filename) or (
+            jsonify({"success": False, "message": "File not found"}),
+            404,
+        )
+    if not is_text_file(file_path):
+        return jsonify({"success": False, "message": "Not a text file"}), 400
+
+    max_lines = app.config["PREVIEW_MAX_LINES"]
+    limits = {
+        "max_line_bytes": app.config["PREVIEW_MAX_LINE_BYTES"],
+        "max_bytes": app.config["PREVIEW_MAX_BYTES"],
+    }
+    args = request.args
+    try:
+        start = max(0, int(args["start"])) if "start" in args else None
+        end = int(args["end"]) if "end" in args else None
+        count = int(args.get("tail", args.get("head", 100)))
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid line number"}), 400
+
+    if start is not None:
+        if end is None:
+            end = start + max_lines
+        count = min(max(0, end - start), max_lines)
+        index = line_indexes.get(
+            file_path, filename, generation=store.generation(filename)
+        )
+        lines, truncated = index.read_lines(start, count, **limits)
+        return jsonify(
+            {
+                "success": True,
+                "filename": filename,
+                "start": start,
+                "lines": lines,
+                "truncated": truncated,
+                "total_lines": index.total_lines,
+            }
+        )
+
+    count = min(max(0, count), max_lines)
+    if "tail" in args:
+        lines, truncated = read_tail(file_path, count, **limits)
+    else:
+        lines, truncated = read_head(file_path, count, **limits)
+    return jsonify(
+        {"success": True, "filename": filename, "lines": lines, "truncated": truncated}
+    )
+
+
+@app.route("/jobs")
+def list_jobs():
+    """Status of recent background jobs, optionally for a single file"""
+    jobs = job_queue.list(request.args.get("filename"))
+    return jsonify({"success": True, "jobs": [job.to_dict() for job in jobs]})
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Job not found"}), 404
+    return jsonify({"success": True, "job": job.to_dict()})
+
+
+# Endpoints used by other nodes of the cluster
+
+
+@app.route("/cluster/nodes", methods=["GET", "POST"])
+@cluster_only
+def cluster_nodes():
+    if request.method == "POST":
+        url = (request.get_json(silent=True) or {}).get("url")
+        if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+            return jsonify({"success": False, "message": "Invalid node URL"}), 400
+        if cluster.add_node(url):
+            # Pass the news on, then move files the new node now owns
+            job_queue.submit("announce", None, announce_job, PRIORITY_HIGH)
+
+    return jsonify({"success": True, "node": cluster.node_url, "nodes": cluster.nodes()})
+
+
+@app.route("/cluster/files")
+@cluster_only
+def cluster_local_files():
+    return jsonify({"success": True, "files": local_file_listing()})
+
+
+@app.route("/cluster/files/<filename>", methods=["GET", "PUT", "DELETE"])
+@cluster_only
+def cluster_file(filename):
+    filename = secure_filename(filename)
+    if filename == "":
+        return jsonify({"success": False, "message": "Invalid filename"}), 400
     file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    if os.path.exists(file_path):
-        os.remove(file_path)
 
-        # Remove from stats
-        stats = get_download_stats()
-        if filename in stats:
-            del stats[filename]
-            save_download_stats(stats)
+    if request.method == "PUT":
+        # A replica pushed by another node
+        save_request_body(filename)
+        schedule_post_upload_jobs(filename, place=False)
+        return jsonify({"success": True})
+
+    if request.method == "DELETE":
+        return jsonify({"success": True, "deleted": remove_local_file(filename)})
+
+    if not os.path.isfile(file_path):
+        return jsonify({"success": False, "message": "File not found"}), 404
+    stat = os.stat(file_path)
+    return jsonify(
+        {
+            "success": True,
+            "filename": filename,
+            "size": stat.st_size,
+            "sha256": current_hash(store.file_hash(filename), stat),
+        }
+    )
 
-    return redirect(url_for("index"))
+
+@app.route("/cluster/downloads/<filename>", methods=["POST"])
+@cluster_only
+def cluster_add_downloads(filename):
+    add = (request.get_json(silent=True) or {}).get("add")
+    if type(add) is not int or add < 0:
+        return jsonify({"success": False, "message": "Invalid download count"}), 400
+    filename = secure_filename(filename)
+    if filename == "":
+        return jsonify({"success": False, "message": "Invalid filename"}), 400
+    store.increment_downloads(filename, add)
+    return jsonify({"success": True})
 
 
 @app.route("/generate_speedtest_file/<int:size>")
@@ -241,558 +829,9 @@ def clean_speedtest_files():
 
 
 if __name__ == "__main__":
-    # Create templates directory and index.html
-    if not os.path.exists("templates"):
-        os.makedirs("templates")
-
-    with open("templates/index.html", "w") as f:
-        f.write(
-            """<!DOCTYPE html>
-<html>
-<head>
-    <title>Local File Sharing</title>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            max-width: 900px;
-            margin: 0 auto;
-            padding: 20px;
-        }
-        h1, h2 {
-            color: #333;
-        }
-        .section {
-            margin: 30px 0;
-            padding: 15px;
-            background-color: #f5f5f5;
-            border-radius: 5px;
-        }
-        .file-list {
-            margin-top: 30px;
-        }
-        .file-item {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            padding: 10px;
-            border-bottom: 1px solid #eee;
-        }
-        .file-name {
-            flex-grow: 1;
-            word-break: break-all;
-        }
-        .file-info {
-            color: #666;
-            margin-right: 15px;
-            white-space: nowrap;
-        }
-        .button, .download-btn, .delete-btn {
-            display: inline-block;
-            padding: 5px 10px;
-            text-decoration: none;
-            border-radius: 3px;
-            color: white;
-            font-size: 14px;
-            cursor: pointer;
-            border: none;
-        }
-        .button {
-            background-color: #2196F3;
-        }
-        .download-btn {
-            background-color: #4CAF50;
-            margin-right: 5px;
-        }
-        .delete-btn {
-            background-color: #f44336;
-        }
-        .empty-list {
-            padding: 20px;
-            color: #666;
-            text-align: center;
-        }
-        .progress-container {
-            width: 100%;
-            background-color: #ddd;
-            border-radius: 3px;
-            margin: 10px 0;
-            display: none;
-        }
-        .progress-bar {
-            width: 0%;
-            height: 20px;
-            background-color: #4CAF50;
-            border-radius: 3px;
-            text-align: center;
-            line-height: 20px;
-            color: white;
-        }
-        .speedtest-results {
-            margin-top: 15px;
-            padding: 10px;
-            background-color: #e8f5e9;
-            border-radius: 3px;
-            display: none;
-        }
-        .speedtest-buttons {
-            display: flex;
-            gap: 10px;
-            margin-top: 10px;
-        }
-        .speedtest-file-sizes {
-            display: flex;
-            gap: 10px;
-            margin: 10px 0;
-        }
-        .speedtest-file-sizes button {
-            flex: 1;
-        }
-        .tabs {
-            display: flex;
-            margin-bottom: 20px;
-            border-bottom: 1px solid #ddd;
-        }
-        .tab {
-            padding: 10px 20px;
-            cursor: pointer;
-            background-color: #f1f1f1;
-            border: 1px solid #ddd;
-            border-bottom: none;
-            border-radius: 5px 5px 0 0;
-            margin-right: 5px;
-        }
-        .tab.active {
-            background-color: white;
-            border-bottom: 1px solid white;
-            margin-bottom: -1px;
-        }
-        .tab-content {
-            display: none;
-        }
-        .tab-content.active {
-            display: block;
-        }
-        .message {
-            padding: 10px;
-            margin: 10px 0;
-            border-radius: 3px;
-            display: none;
-        }
-        .success {
-            background-color: #dff0d8;
-            color: #3c763d;
-        }
-        .error {
-            background-color: #f2dede;
-            color: #a94442;
-        }
-    </style>
-</head>
-<body>
-    <h1>Local File Sharing</h1>
-    
-    <div class="tabs">
-        <div class="tab active" data-tab="files">Files</div>
-        <div class="tab" data-tab="speedtest">Speed Test</div>
-    </div>
-    
-    <div id="filesTab" class="tab-content active">
-        <div class="section">
-            <h2>Upload File</h2>
-            <div id="uploadMessage" class="message"></div>
-            <form id="uploadForm" enctype="multipart/form-data">
-                <input type="file" id="fileInput" name="file" required>
-                <button type="submit" class="button">Upload</button>
-                <div class="progress-container" id="uploadProgressContainer">
-                    <div class="progress-bar" id="uploadProgressBar">0%</div>
-                </div>
-                <div id="uploadSpeed" style="margin-top: 5px;"></div>
-            </form>
-        </div>
-        
-        <div class="file-list">
-            <h2>Available Files</h2>
-            <div id="filesList">
-                {% if files %}
-                    {% for file in files %}
-                        <div class="file-item">
-                            <div class="file-name">{{ file.name }}</div>
-                            <div class="file-info">{{ file.size }} | {{ file.downloads }} downloads</div>
-                            <a href="#" class="download-btn" data-filename="{{ file.name }}" data-size="{{ file.size_bytes }}">Download</a>
-                            <a href="{{ url_for('delete_file', filename=file.name) }}" class="delete-btn" onclick="return confirm('Are you sure you want to delete this file?')">Delete</a>
-                        </div>
-                        <div class="progress-container download-progress" id="download-{{ file.name }}" style="display: none;">
-                            <div class="progress-bar">0%</div>
-                        </div>
-                    {% endfor %}
-                {% else %}
-                    <div class="empty-list">No files available</div>
-                {% endif %}
-            </div>
-        </div>
-    </div>
-    
-    <div id="speedtestTab" class="tab-content">
-        <div class="section">
-            <h2>Network Speed Test</h2>
-            <p>Test your connection speed with this server:</p>
-            
-            <h3>Download Speed Test</h3>
-            <div class="speedtest-file-sizes">
-                <button class="button" onclick="startDownloadTest(5)">5 MB</button>
-                <button class="button" onclick="startDownloadTest(10)">10 MB</button>
-                <button class="button" onclick="startDownloadTest(25)">25 MB</button>
-                <button class="button" onclick="startDownloadTest(50)">50 MB</button>
-            </div>
-            <div class="progress-container" id="downloadTestProgress">
-                <div class="progress-bar" id="downloadTestProgressBar">0%</div>
-            </div>
-            <div id="downloadTestResult" class="speedtest-results"></div>
-            
-            <h3>Upload Speed Test</h3>
-            <div class="speedtest-file-sizes">
-                <button class="button" onclick="startUploadTest(5)">5 MB</button>
-                <button class="button" onclick="startUploadTest(10)">10 MB</button>
-                <button class="button" onclick="startUploadTest(25)">25 MB</button>
-                <button class="button" onclick="startUploadTest(50)">50 MB</button>
-            </div>
-            <div class="progress-container" id="uploadTestProgress">
-                <div class="progress-bar" id="uploadTestProgressBar">0%</div>
-            </div>
-            <div id="uploadTestResult" class="speedtest-results"></div>
-        </div>
-    </div>
-
-    <script>
-        // Tab functionality
-        document.querySelectorAll('.tab').forEach(tab => {
-            tab.addEventListener('click', () => {
-                // Remove active class from all tabs and content
-                document.querySelectorAll('.tab').forEach(t => t.classList.remove('active'));
-                document.querySelectorAll('.tab-content').forEach(c => c.classList.remove('active'));
-                
-                // Add active class to clicked tab and corresponding content
-                tab.classList.add('active');
-                document.getElementById(tab.dataset.tab + 'Tab').classList.add('active');
-            });
-        });
-        
-        // File upload with progress bar
-        document.getElementById('uploadForm').addEventListener('submit', function(e) {
-            e.preventDefault();
-            
-            const fileInput = document.getElementById('fileInput');
-            const file = fileInput.files[0];
-            
-            if (!file) {
-                showMessage('uploadMessage', 'Please select a file to upload', 'error');
-                return;
-            }
-            
-            const formData = new FormData();
-            formData.append('file', file);
-            
-            const xhr = new XMLHttpRequest();
-            
-            // Setup progress event
-            xhr.upload.addEventListener('progress', (event) => {
-                if (event.lengthComputable) {
-                    const percentComplete = Math.round((event.loaded / event.total) * 100);
-                    document.getElementById('uploadProgressContainer').style.display = 'block';
-                    document.getElementById('uploadProgressBar').style.width = percentComplete + '%';
-                    document.getElementById('uploadProgressBar').textContent = percentComplete + '%';
-                    
-                    // Calculate and display upload speed
-                    const elapsedTime = (new Date().getTime() - uploadStartTime) / 1000; // seconds
-                    if (elapsedTime > 0) {
-                        const bytesPerSecond = event.loaded / elapsedTime;
-                        const mbps = (bytesPerSecond / (1024 * 1024)).toFixed(2);
-                        document.getElementById('uploadSpeed').textContent = `Current speed: ${mbps} MB/s`;
-                    }
-                }
-            });
-            
-            xhr.onreadystatechange = function() {
-                if (xhr.readyState === 4) {
-                    if (xhr.status === 200) {
-                        const response = JSON.parse(xhr.responseText);
-                        if (response.success) {
-                            showMessage('uploadMessage', 'File uploaded successfully! ' + response.upload_speed, 'success');
-                            // Reload the page to show the new file
-                            setTimeout(() => {
-                                window.location.reload();
-                            }, 1500);
-                        } else {
-                            showMessage('uploadMessage', 'Upload failed: ' + response.message, 'error');
-                        }
-                    } else {
-                        showMessage('uploadMessage', 'Upload failed. Server error.', 'error');
-                    }
-                }
-            };
-            
-            // Start upload
-            const uploadStartTime = new Date().getTime();
-            xhr.open('POST', '/upload', true);
-            xhr.send(formData);
-        });
-        
-        // File download with progress bar
-        document.querySelectorAll('.download-btn').forEach(btn => {
-            btn.addEventListener('click', function(e) {
-                e.preventDefault();
-                
-                const filename = this.dataset.filename;
-                const fileSize = parseInt(this.dataset.size);
-                const progressContainer = document.getElementById('download-' + filename);
-                const progressBar = progressContainer.querySelector('.progress-bar');
-                
-                // Show progress container
-                progressContainer.style.display = 'block';
-                progressBar.style.width = '0%';
-                progressBar.textContent = '0%';
-                
-                // Create a hidden iframe to avoid page navigation
-                const iframe = document.createElement('iframe');
-                iframe.style.display = 'none';
-                document.body.appendChild(iframe);
-                
-                // Track download progress
-                const downloadStartTime = new Date().getTime();
-                let lastCheckedAt = downloadStartTime;
-                let lastCheckedSize = 0;
-                
-                // Poll download progress
-                const progressInterval = setInterval(() => {
-                    // Simulate progress since browser doesn't provide direct download progress
-                    // This is a rough estimation
-                    const elapsedMs = new Date().getTime() - downloadStartTime;
-                    const estimatedProgress = Math.min(99, Math.round((elapsedMs / (fileSize / 50000)) * 100));
-                    
-                    progressBar.style.width = estimatedProgress + '%';
-                    progressBar.textContent = estimatedProgress + '%';
-                    
-                    // If we estimate it's likely finished
-                    if (estimatedProgress >= 99) {
-                        clearInterval(progressInterval);
-                        setTimeout(() => {
-                            progressBar.style.width = '100%';
-                            progressBar.textContent = '100%';
-                            
-                            // Hide progress bar after a short delay
-                            setTimeout(() => {
-                                progressContainer.style.display = 'none';
-                            }, 1000);
-                        }, 500);
-                    }
-                }, 100);
-                
-                // Start the download
-                iframe.src = '/download/' + encodeURIComponent(filename);
-            });
-        });
-        
-        // Download speed test
-        function startDownloadTest(sizeMb) {
-            // Show progress bar
-            const progressContainer = document.getElementById('downloadTestProgress');
-            const progressBar = document.getElementById('downloadTestProgressBar');
-            progressContainer.style.display = 'block';
-            progressBar.style.width = '0%';
-            progressBar.textContent = 'Generating test file...';
-            
-            // First request a test file of the specified size
-            fetch('/generate_speedtest_file/' + sizeMb)
-                .then(response => response.json())
-                .then(data => {
-                    if (data.success) {
-                        // Now download the file and measure speed
-                        const filename = data.filename;
-                        const fileSize = data.size_mb * 1024 * 1024; // Convert MB to bytes
-                        
-                        const downloadStartTime = new Date().getTime();
-                        progressBar.textContent = 'Downloading...';
-                        
-                        // Create XMLHttpRequest to track download progress
-                        const xhr = new XMLHttpRequest();
-                        xhr.open('GET', '/speedtest/download/' + encodeURIComponent(filename), true);
-                        xhr.responseType = 'blob';
-                        
-                        xhr.addEventListener('progress', (event) => {
-                            if (event.lengthComputable) {
-                                const percentComplete = Math.round((event.loaded / event.total) * 100);
-                                progressBar.style.width = percentComplete + '%';
-                                progressBar.textContent = percentComplete + '%';
-                                
-                                // Calculate current speed
-                                const elapsedSeconds = (new Date().getTime() - downloadStartTime) / 1000;
-                                if (elapsedSeconds > 0) {
-                                    const mbps = (event.loaded / elapsedSeconds / 1024 / 1024).toFixed(2);
-                                    document.getElementById('downloadTestResult').style.display = 'block';
-                                    document.getElementById('downloadTestResult').innerHTML = 
-                                        `Current Download Speed: <strong>${mbps} MB/s</strong><br>` +
-                                        `Downloaded: ${Math.round(event.loaded/1024/1024)}/${Math.round(event.total/1024/1024)} MB`;
-                                }
-                            }
-                        });
-                        
-                        xhr.addEventListener('load', () => {
-                            if (xhr.status === 200) {
-                                const downloadTime = (new Date().getTime() - downloadStartTime) / 1000;
-                                const speed = fileSize / downloadTime / 1024 / 1024;
-                                
-                                progressBar.style.width = '100%';
-                                progressBar.textContent = '100%';
-                                
-                                document.getElementById('downloadTestResult').style.display = 'block';
-                                document.getElementById('downloadTestResult').innerHTML = 
-                                    `Download Speed: <strong>${speed.toFixed(2)} MB/s</strong><br>` +
-                                    `Downloaded: ${sizeMb} MB in ${downloadTime.toFixed(2)} seconds`;
-                                    
-                                // Clean up the test file
-                                fetch('/clean_speedtest_files');
-                            }
-                        });
-                        
-                        xhr.addEventListener('error', () => {
-                            document.getElementById('downloadTestResult').style.display = 'block';
-                            document.getElementById('downloadTestResult').innerHTML = 'Download test failed';
-                            progressContainer.style.display = 'none';
-                        });
-                        
-                        xhr.send();
-                    } else {
-                        document.getElementById('downloadTestResult').style.display = 'block';
-                        document.getElementById('downloadTestResult').innerHTML = 'Failed to generate test file: ' + data.message;
-                        progressContainer.style.display = 'none';
-                    }
-                })
-                .catch(error => {
-                    document.getElementById('downloadTestResult').style.display = 'block';
-                    document.getElementById('downloadTestResult').innerHTML = 'Error: ' + error;
-                    progressContainer.style.display = 'none';
-                });
-        }
-        
-        // Upload speed test
-        function startUploadTest(sizeMb) {
-            // Show progress bar
-            const progressContainer = document.getElementById('uploadTestProgress');
-            const progressBar = document.getElementById('uploadTestProgressBar');
-            progressContainer.style.display = 'block';
-            progressBar.style.width = '0%';
-            progressBar.textContent = 'Generating test file...';
-            
-            document.getElementById('uploadTestResult').style.display = 'block';
-            document.getElementById('uploadTestResult').innerHTML = 'Preparing test data...';
-            
-            // Generate random data for upload
-            const byteSize = sizeMb * 1024 * 1024;
-            const chunkSize = 1024 * 1024; // 1MB chunks
-            const totalChunks = Math.ceil(byteSize / chunkSize);
-            let generatedSize = 0;
-            const chunks = [];
-            
-            // Generate data in smaller chunks to avoid browser memory issues
-            function generateNextChunk() {
-                if (generatedSize >= byteSize) {
-                    performUploadTest();
-                    return;
-                }
-                
-                const currentChunkSize = Math.min(chunkSize, byteSize - generatedSize);
-                const chunk = new Uint8Array(currentChunkSize);
-                
-                // Fill with random data
-                window.crypto.getRandomValues(chunk);
-                chunks.push(chunk);
-                
-                generatedSize += currentChunkSize;
-                const percentDone = Math.round((generatedSize / byteSize) * 100);
-                
-                progressBar.style.width = percentDone + '%';
-                progressBar.textContent = 'Preparing: ' + percentDone + '%';
-                
-                // Continue generating data in the next tick to avoid UI freezing
-                setTimeout(generateNextChunk, 0);
-            }
-            
-            function performUploadTest() {
-                // Create a file from the generated chunks
-                const blob = new Blob(chunks);
-                const testFile = new File([blob], 'speedtest_upload.bin', { type: 'application/octet-stream' });
-                
-                // Prepare form data
-                const formData = new FormData();
-                formData.append('file', testFile);
-                formData.append('file_size', byteSize);
-                formData.append('start_time', new Date().getTime() / 1000);
-                
-                const xhr = new XMLHttpRequest();
-                
-                // Setup progress event
-                xhr.upload.addEventListener('progress', (event) => {
-                    if (event.lengthComputable) {
-                        const percentComplete = Math.round((event.loaded / event.total) * 100);
-                        progressBar.style.width = percentComplete + '%';
-                        progressBar.textContent = percentComplete + '%';
-                        
-                        // Calculate current speed
-                        const elapsedSeconds = (new Date().getTime() / 1000) - parseFloat(formData.get('start_time'));
-                        if (elapsedSeconds > 0) {
-                            const mbps = (event.loaded / elapsedSeconds / 1024 / 1024).toFixed(2);
-                            document.getElementById('uploadTestResult').innerHTML = 
-                                `Current Upload Speed: <strong>${mbps} MB/s</strong><br>` +
-                                `Uploaded: ${Math.round(event.loaded/1024/1024)}/${Math.round(event.total/1024/1024)} MB`;
-                        }
-                    }
-                });
-                
-                xhr.onreadystatechange = function() {
-                    if (xhr.readyState === 4) {
-                        if (xhr.status === 200) {
-                            const response = JSON.parse(xhr.responseText);
-                            if (response.success) {
-                                document.getElementById('uploadTestResult').innerHTML = 
-                                    `Upload Speed: <strong>${response.upload_speed_formatted}</strong><br>` +
-                                    `Uploaded: ${sizeMb} MB in ${response.duration}`;
-                            } else {
-                                document.getElementById('uploadTestResult').innerHTML = 'Upload test failed: ' + response.message;
-                            }
-                        } else {
-                            document.getElementById('uploadTestResult').innerHTML = 'Upload test failed. Server error.';
-                        }
-                    }
-                };
-                
-                // Start upload
-                xhr.open('POST', '/speedtest/upload', true);
-                xhr.send(formData);
-            }
-            
-            // Start generating data
-            generateNextChunk();
-        }
-        
-        // Helper to show messages
-        function showMessage(elementId, message, type) {
-            const messageElement = document.getElementById(elementId);
-            messageElement.textContent = message;
-            messageElement.className = 'message ' + type;
-            messageElement.style.display = 'block';
-            
-            // Auto-hide after 5 seconds
-            setTimeout(() => {
-                messageElement.style.display = 'none';
-            }, 5000);
-        }
-        
-        // Global upload start time
-        let uploadStartTime = 0;
-    </script>
-</body>
-</html>"""
-        )
+    # With the reloader on, only the child process actually serves requests
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_cluster()
 
     # Run the app on all network interfaces
     app.run(host="0.0.0.0", port=5000, debug=True)
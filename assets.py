@@ -0,0 +1,111 @@
+"""Static asset pipeline.
+
+Every file under the static folder is loaded once at start-up, given a
+content-hashed name (app.js -> app.1a2b3c4d.js) and compressed in memory with
+gzip and, if the brotli package is installed, brotli. Because the name changes
+whenever the content does, the files can be cached by browsers forever.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, abort, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Don't bother compressing files that are already compressed or tiny
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+MIN_COMPRESS_SIZE = 256
+
+
+class Asset:
+    def __init__(self, name, hashed_name, data):
+        self.name = name
+        self.hashed_name = hashed_name
+        self.mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.etag = hashed_name
+        # Content-Encoding -> body
+        self.variants = {"identity": data}
+
+        if len(data) >= MIN_COMPRESS_SIZE and self.mimetype.startswith(
+            COMPRESSIBLE_TYPES
+        ):
+            gzipped = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gzipped) < len(data):
+                self.variants["gzip"] = gzipped
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data):
+                    self.variants["br"] = compressed
+
+    def pick_encoding(self, accept_encodings):
+        # The client's most preferred variant, the smallest one on a tie
+        best, best_quality = "identity", 0
+        for encoding in ("br", "gzip"):
+            quality = accept_encodings.quality(encoding)
+            if encoding in self.variants and quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+
+class AssetPipeline:
+    def __init__(self, app=None, folder="static", url_prefix="/assets"):
+        self.folder = folder
+        self.url_prefix = url_prefix
+        self.assets = {}  # logical name -> Asset
+        self.by_hashed_name = {}  # hashed name -> Asset
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.folder = os.path.join(app.root_path, self.folder)
+        self.load()
+        app.add_url_rule(
+            self.url_prefix + "/<path:hashed_name>", "asset", self.serve
+        )
+        app.jinja_env.globals["asset_url"] = self.url_for
+
+    def load(self):
+        self.assets = {}
+        self.by_hashed_name = {}
+        if not os.path.isdir(self.folder):
+            return
+
+        for root, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.folder).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    data = f.read()
+
+                digest = hashlib.sha256(data).hexdigest()[:12]
+                base, ext = os.path.splitext(name)
+                asset = Asset(name, f"{base}.{digest}{ext}", data)
+                self.assets[name] = asset
+                self.by_hashed_name[asset.hashed_name] = asset
+
+    def url_for(self, name):
+        return f"{self.url_prefix}/{self.assets[name].hashed_name}"
+
+    def serve(self, hashed_name):
+        asset = self.by_hashed_name.get(hashed_name)
+        if asset is None:
+            abort(404)
+
+        encoding = asset.pick_encoding(request.accept_encodings)
+        response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        # Each encoding is a different body, so each needs its own strong ETag
+        response.set_etag(
+            asset.etag if encoding == "identity" else f"{asset.etag}-{encoding}"
+        )
+        return response.make_conditional(request)
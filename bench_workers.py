@@ -0,0 +1,90 @@
+"""Benchmark download throughput with several worker processes.
+
+Each worker process imports the app and downloads the same small file over and
+over through the WSGI interface, exactly as it would under a pre-forking
+server such as gunicorn, minus the network. At the end the download count kept
+in the shared store must equal the number of downloads made, however many
+workers there were.
+
+    python bench_workers.py --workers 1 2 4 8 --requests 2000
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+BENCH_FILE = "bench.txt"
+BENCH_SIZE = 4096
+
+
+def run_worker(workdir, requests, barrier):
+    os.chdir(workdir)
+    import app as file_app
+
+    client = file_app.app.test_client()
+    barrier.wait()
+    for _ in range(requests):
+        response = client.get("/download/" + BENCH_FILE)
+        # Only count runs that actually served the file
+        assert response.status_code == 200, response.status_code
+        assert len(response.get_data()) == BENCH_SIZE
+        response.close()
+
+
+def run(workers, requests):
+    workdir = tempfile.mkdtemp(prefix="bench_workers_")
+    try:
+        os.chdir(workdir)
+        os.makedirs("uploads")
+        with open(os.path.join("uploads", BENCH_FILE), "wb") as f:
+            f.write(b"x" * BENCH_SIZE)
+
+        ctx = multiprocessing.get_context("spawn")
+        # Released once every worker has imported the app and the clock starts
+        barrier = ctx.Barrier(workers + 1)
+        processes = [
+            ctx.Process(target=run_worker, args=(workdir, requests, barrier))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        barrier.wait()
+        start = time.perf_counter()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        if any(process.exitcode != 0 for process in processes):
+            raise RuntimeError("a worker failed; see its traceback above")
+
+        from store import SharedStore
+
+        counted = SharedStore("file_share.db").download_stats().get(BENCH_FILE, 0)
+        return elapsed, counted
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=2000, help="per worker")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'requests':>9} {'seconds':>8} {'req/s':>9} {'counted':>8}")
+    for workers in args.workers:
+        total = workers * args.requests
+        elapsed, counted = run(workers, args.requests)
+        status = "ok" if counted == total else "LOST COUNTS"
+        print(
+            f"{workers:>8} {total:>9} {elapsed:>8.2f} {total / elapsed:>9.0f}"
+            f" {counted:>8} {status}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Running several instances of the app as one replicated cluster.
+
+Files are placed on nodes by consistent hashing: each node owns many points on
+a hash ring and a file belongs to the first REPLICATION_FACTOR distinct nodes
+found walking clockwise from the hash of its name. Adding a node only moves
+the files whose owners changed. Nodes talk to each other over plain HTTP on
+the /cluster/... endpoints.
+"""
+import bisect
+import hashlib
+import json
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+VIRTUAL_NODES = 64
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        self.nodes = sorted(set(nodes))
+        points = sorted(
+            (ring_hash(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(virtual_nodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owners(self, key, count):
+        """The first count distinct nodes clockwise from the key's hash"""
+        owners = []
+        if not self._hashes:
+            return owners
+        count = min(count, len(self.nodes))
+        start = bisect.bisect(self._hashes, ring_hash(key))
+        for i in range(len(self._nodes)):
+            node = self._nodes[(start + i) % len(self._nodes)]
+            if node not in owners:
+                owners.append(node)
+                if len(owners) == count:
+                    break
+        return owners
+
+
+class ClusterError(Exception):
+    pass
+
+
+class Cluster:
+    def __init__(self, node_url, store, replication_factor=2, timeout=10):
+        self.node_url = node_url.rstrip("/")
+        self.store = store
+        self.replication_factor = replication_factor
+        self.timeout = timeout
+        self._ring = HashRing([])
+
+    # Membership is kept in the shared store so every worker process agrees
+
+    def nodes(self):
+        return sorted(set(self.store.cluster_nodes()) | {self.node_url})
+
+    def peers(self):
+        return [node for node in self.nodes() if node != self.node_url]
+
+    def add_node(self, url):
+        """Add a node to the membership; returns True if it was new"""
+        return self.store.add_cluster_node(url.rstrip("/"))
+
+    @property
+    def ring(self):
+        nodes = self.nodes()
+        if nodes != self._ring.nodes:
+            self._ring = HashRing(nodes)
+        return self._ring
+
+    def owners(self, filename):
+        return self.ring.owners(filename, self.replication_factor)
+
+    # Talking to other nodes
+
+    def _file_url(self, node, filename):
+        return f"{node}/cluster/files/{urllib.parse.quote(filename)}"
+
+    def _request(self, url, method="GET", data=None, headers=None):
+        req = urllib.request.Request(url, data=data, method=method, headers=headers or {})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+        except (urllib.error.URLError, OSError) as e:
+            raise ClusterError(f"{url}: {e}")
+
+    def _post_json(self, url, payload):
+        return self._request(
+            url,
+            "POST",
+            json.dumps(payload).encode("utf-8"),
+            {"Content-Type": "application/json"},
+        )
+
+    def announce(self, node):
+        """Tell a node about every member we know of, including ourselves"""
+        for member in self.nodes():
+            self._post_json(f"{node}/cluster/nodes", {"url": member})
+
+    def file_info(self, node, filename):
+        """Size etc. of a node's copy of a file, or None if it has none"""
+        status, body = self._request(self._file_url(node, filename))
+        if status == 404:
+            return None
+        if status != 200:
+            raise ClusterError(f"{node}: lookup of {filename} failed with {status}")
+        return json.loads(body)
+
+    def push_file(self, node, filename, path):
+        with open(path, "rb") as f:
+            status, body = self._request(
+                self._file_url(node, filename),
+                "PUT",
+                f,
+                {
+                    "Content-Length": str(os.fstat(f.fileno()).st_size),
+                    "Content-Type": "application/octet-stream",
+                    "X-File-Mtime": repr(os.fstat(f.fileno()).st_mtime),
+                },
+            )
+        if status != 200:
+            raise ClusterError(f"{node} rejected {filename}: {status} {body[:200]!r}")
+
+    def delete_file(self, node, filename):
+        self._request(self._file_url(node, filename), "DELETE")
+
+    def add_downloads(self, node, filename, count):
+        status, _ = self._post_json(
+            f"{node}/cluster/downloads/{urllib.parse.quote(filename)}", {"add": count}
+        )
+        if status != 200:
+            raise ClusterError(f"{node}: adding downloads of {filename} failed with {status}")
+
+    def list_files(self, node):
+        status, body = self._request(f"{node}/cluster/files")
+        if status != 200:
+            raise ClusterError(f"{node}: listing failed with {status}")
+        return json.loads(body)["files"]
+
+    def manifest(self, node):
+        status, body = self._request(f"{node}/api/manifest?local=1")
+        if status != 200:
+            raise ClusterError(f"{node}: manifest failed with {status}")
+        return json.loads(body)["files"]
+
+    # Cluster-wide operations
+
+    def _each_peer(self, func):
+        """Call func(node) for every peer in parallel, skipping unreachable ones"""
+        peers = self.peers()
+        if not peers:
+            return {}
+
+        def attempt(node):
+            try:
+                return func(node)
+            except ClusterError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=len(peers)) as pool:
+            return dict(zip(peers, pool.map(attempt, peers)))
+
+    def merged_listing(self, local_files):
+        """Merge [name, size, downloads] listings from every reachable node.
+        Downloads are summed, since each node counts what it served itself."""
+        merged = {name: [name, size, downloads] for name, size, downloads in local_files}
+        for files in self._each_peer(self.list_files).values():
+            for name, size, downloads in files or []:
+                if name in merged:
+                    merged[name][1] = max(merged[name][1], size)
+                    merged[name][2] += downloads
+                else:
+                    merged[name] = [name, size, downloads]
+        return sorted(merged.values())
+
+    def merged_manifest(self, local_entries):
+        """Merge [name, size, mtime, sha256] manifests from every reachable
+        node, preferring entries whose hash is already known"""
+        merged = {entry[0]: entry for entry in local_entries}
+        for entries in self._each_peer(self.manifest).values():
+            for entry in entries or []:
+                known = merged.get(entry[0])
+                if known is None or (known[3] is None and entry[3] is not None):
+                    merged[entry[0]] = entry
+        return sorted(merged.values())
+
+    def locate(self, filename):
+        """A node holding the file, trying its owners first"""
+        owners = self.owners(filename)
+        others = [node for node in self.peers() if node not in owners]
+        for node in owners + others:
+            if node == self.node_url:
+                continue
+            try:
+                if self.file_info(node, filename) is not None:
+                    return node
+            except ClusterError:
+                continue
+        return None
+
+    def delete_everywhere(self, filename):
+        self._each_peer(lambda node: self.delete_file(node, filename))
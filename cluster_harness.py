@@ -0,0 +1,204 @@
+"""Run a small cluster on loopback and check that it behaves.
+
+Starts several nodes as separate processes on 127.0.0.1, each with its own
+working directory, uploads files through one of them and checks that:
+
+- every file ends up on exactly the nodes the hash ring says own it
+- any node lists every file and serves or redirects any download
+- after another node joins, files are rebalanced onto it in the background
+- deleting a file through any node removes it everywhere
+
+    python cluster_harness.py --nodes 3 --files 30 --replication 2
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from cluster import HashRing
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NODE_SCRIPT = (
+    "import sys; sys.path.insert(0, {here!r}); import app; app.start_cluster(); "
+    "app.app.run(host='127.0.0.1', port={port}, threaded=True)"
+)
+
+
+def start_node(workdir, port, seeds, replication):
+    url = f"http://127.0.0.1:{port}"
+    node_dir = os.path.join(workdir, f"node{port}")
+    os.makedirs(node_dir)
+    env = dict(
+        os.environ,
+        NODE_URL=url,
+        CLUSTER_NODES=",".join(seeds),
+        REPLICATION_FACTOR=str(replication),
+    )
+    log = open(os.path.join(node_dir, "node.log"), "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-c", NODE_SCRIPT.format(here=HERE, port=port)],
+        cwd=node_dir,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    wait_for(lambda: get_json(url + "/cluster/nodes"), f"{url} to start")
+    return url, process
+
+
+def get_json(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return json.loads(response.read())
+    except (urllib.error.URLError, OSError):
+        return None
+
+
+def wait_for(condition, what, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.2)
+    raise RuntimeError(f"timed out waiting for {what}")
+
+
+def upload(node, filename, content):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(
+        node + "/upload",
+        data=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def jobs_idle(nodes):
+    for node in nodes:
+        jobs = get_json(node + "/jobs")
+        if jobs is None or any(
+            job["status"] in ("queued", "running") for job in jobs["jobs"]
+        ):
+            return False
+    return True
+
+
+def placement(nodes):
+    """filename -> set of nodes that hold it"""
+    holders = {}
+    for node in nodes:
+        for name, _, _ in get_json(node + "/cluster/files")["files"]:
+            holders.setdefault(name, set()).add(node)
+    return holders
+
+
+def check_placement(nodes, expected_files, replication):
+    ring = HashRing(nodes)
+    holders = placement(nodes)
+    problems = []
+    for name in expected_files:
+        owners = set(ring.owners(name, replication))
+        if holders.get(name) != owners:
+            problems.append(f"{name}: on {sorted(holders.get(name, []))}, owners {sorted(owners)}")
+    return problems
+
+
+def settle(nodes, expected_files, replication):
+    # Rebalancing is asynchronous; wait until every node is idle and agrees
+    wait_for(
+        lambda: jobs_idle(nodes)
+        and not check_placement(nodes, expected_files, replication),
+        "files to reach their owners",
+        timeout=60,
+    )
+
+
+def run(node_count, file_count, replication, base_port):
+    workdir = tempfile.mkdtemp(prefix="cluster_harness_")
+    processes = []
+    try:
+        ports = list(range(base_port, base_port + node_count))
+        seeds = [f"http://127.0.0.1:{port}" for port in ports]
+        nodes = []
+        for port in ports:
+            url, process = start_node(workdir, port, seeds, replication)
+            nodes.append(url)
+            processes.append(process)
+        print(f"started {len(nodes)} nodes, replication factor {replication}")
+
+        files = {f"file{i:03d}.txt": os.urandom(1024 + i) for i in range(file_count)}
+        start = time.time()
+        for name, content in files.items():
+            upload(nodes[0], name, content)
+        print(f"uploaded {file_count} files through {nodes[0]} in {time.time() - start:.2f}s")
+
+        settle(nodes, files, replication)
+        print("placement matches the hash ring")
+
+        for node in nodes:
+            listed = {name for name, _, _ in get_json(node + "/api/files")["files"]}
+            assert listed == set(files), f"{node} lists {len(listed)} files"
+        print("every node lists every file")
+
+        for i, (name, content) in enumerate(files.items()):
+            node = nodes[i % len(nodes)]
+            with urllib.request.urlopen(f"{node}/download/{name}", timeout=30) as response:
+                assert response.read() == content, f"wrong content for {name} via {node}"
+        print("every file downloads correctly through any node")
+
+        port = base_port + node_count
+        url, process = start_node(workdir, port, [nodes[0]], replication)
+        processes.append(process)
+        nodes.append(url)
+        start = time.time()
+        wait_for(
+            lambda: all(
+                len(get_json(node + "/cluster/nodes")["nodes"]) == len(nodes)
+                for node in nodes
+            ),
+            "membership to converge",
+        )
+        settle(nodes, files, replication)
+        moved = sum(1 for holders in placement(nodes).values() if url in holders)
+        print(f"added {url}: {moved} files rebalanced onto it in {time.time() - start:.2f}s")
+
+        victim = next(iter(files))
+        urllib.request.urlopen(f"{nodes[1]}/delete/{victim}", timeout=30).read()
+        assert victim not in placement(nodes), f"{victim} survived deletion"
+        print("deleting through one node removes the file everywhere")
+
+        print("OK")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--files", type=int, default=30)
+    parser.add_argument("--replication", type=int, default=2)
+    parser.add_argument("--port", type=int, default=15000, help="first node's port")
+    args = parser.parse_args()
+    run(args.nodes, args.files, args.replication, args.port)
+
+
+if __name__ == "__main__":
+    main()
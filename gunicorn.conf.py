@@ -0,0 +1,9 @@
+"""Settings gunicorn picks up when started from this directory."""
+
+
+def post_worker_init(worker):
+    # Each worker joins the cluster once it is ready to serve (a no-op unless
+    # NODE_URL is set); python app.py does the same for the dev server
+    import app
+
+    app.start_cluster()
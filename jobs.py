@@ -0,0 +1,198 @@
+"""Background job queue for work that runs after a file is uploaded.
+
+Jobs are run by a small, bounded pool of daemon threads. Each job is keyed by
+(kind, filename) so submitting the same work twice for a file only queues it
+once, and every job for a file can be cancelled when the file is deleted.
+"""
+import collections
+import heapq
+import itertools
+import threading
+import time
+import uuid
+
+# Lower numbers run first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job when it has been cancelled"""
+
+
+class Job:
+    def __init__(self, queue, kind, filename, func, priority):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.filename = filename
+        self.func = func
+        self.priority = priority
+        self.status = "queued"  # queued, running, done, failed or cancelled
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._queue = queue
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+        if self.status == "queued":
+            self.status = "cancelled"
+            self.finished = time.time()
+
+    def checkpoint(self):
+        """Call between chunks of work: stops a cancelled job and backs off
+        while live transfers are in progress"""
+        if self.cancelled:
+            raise JobCancelled()
+        self._queue.wait_for_idle(self)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "filename": self.filename,
+            "priority": self.priority,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobQueue:
+    def __init__(
+        self, workers=2, busy=None, history=200, poll_interval=0.05, max_defer=5.0
+    ):
+        self.workers = workers
+        self.history = history
+        self.poll_interval = poll_interval
+        # Callable returning True while live transfers should take precedence
+        self._busy = busy
+        # Longest a job backs off at once, so constant traffic can't starve it
+        self.max_defer = max_defer
+        self._cond = threading.Condition()
+        self._heap = []
+        self._counter = itertools.count()
+        self._jobs = {}  # job id -> Job, in submission order
+        self._finished = collections.deque()  # finished Jobs, oldest first
+        self._active = {}  # filename -> {kind: queued or running Job}
+        self._threads = []
+
+    def submit(self, kind, filename, func, priority=PRIORITY_NORMAL, replace=True):
+        """Queue func(job) to run in the background and return the Job.
+
+        If the same kind of job is already queued for this file the existing
+        job is returned. A running one is cancelled and replaced, since the
+        file has changed underneath it, unless replace is False.
+        """
+        with self._cond:
+            active = self._active.setdefault(filename, {})
+            existing = active.get(kind)
+            if existing is not None and not existing.cancelled:
+                if existing.status == "queued" or not replace:
+                    return existing
+                self._cancel(existing)
+
+            job = Job(self, kind, filename, func, priority)
+            self._jobs[job.id] = job
+            active[kind] = job
+            heapq.heappush(self._heap, (priority, next(self._counter), job))
+            self._trim_history()
+            self._start_workers()
+            self._cond.notify()
+        return job
+
+    def cancel(self, filename):
+        """Cancel every queued or running job for a file"""
+        with self._cond:
+            active = self._active.pop(filename, {})
+            for job in active.values():
+                self._cancel(job)
+        return len(active)
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def list(self, filename=None):
+        with self._cond:
+            jobs = list(self._jobs.values())
+        if filename is not None:
+            jobs = [job for job in jobs if job.filename == filename]
+        return jobs
+
+    def wait_for_idle(self, job):
+        if self._busy is None:
+            return
+        deadline = time.monotonic() + self.max_defer
+        while self._busy() and time.monotonic() < deadline:
+            if job.cancelled:
+                raise JobCancelled()
+            time.sleep(self.poll_interval)
+
+    def _start_workers(self):
+        # Threads are started on first use so importing the app stays cheap
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._worker, name=f"job-worker-{len(self._threads)}"
+            )
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _cancel(self, job):
+        queued = job.status == "queued"
+        job.cancel()
+        # A running job is recorded as finished by its worker
+        if queued:
+            self._finished.append(job)
+
+    def _trim_history(self):
+        # Forget the oldest finished jobs; queued and running ones are kept
+        while len(self._jobs) > self.history and self._finished:
+            self._jobs.pop(self._finished.popleft().id, None)
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+                job.status = "running"
+                job.started = time.time()
+                return job
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            try:
+                self.wait_for_idle(job)
+                job.result = job.func(job)
+                job.status = "done"
+            except JobCancelled:
+                job.status = "cancelled"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+            job.finished = time.time()
+
+            with self._cond:
+                self._finished.append(job)
+                active = self._active.get(job.filename)
+                if active is not None and active.get(job.kind) is job:
+                    del active[job.kind]
+                    if not active:
+                        del self._active[job.filename]
+                self._trim_history()
@@ -0,0 +1,340 @@
+"""Partial previews of large text files.
+
+Reading the head or tail of a file needs no index. Arbitrary line ranges use a
+sparse line index: the byte offset of every STRIDE-th line, kept in a compact
+array('Q') and saved to disk so it is only built once. When a file
+grows (e.g. a log being appended to) only the new bytes are scanned.
+
+Every preview is bounded: lines longer than MAX_LINE_BYTES are cut short and
+at most MAX_PREVIEW_BYTES of the file are read for one preview.
+"""
+import array
+import itertools
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+DEFAULT_STRIDE = 128
+SCAN_CHUNK = 16 * 1024 * 1024
+READ_BLOCK = 64 * 1024
+# Longest line returned in full, and most bytes read for one preview
+MAX_LINE_BYTES = 8 * 1024
+MAX_PREVIEW_BYTES = 1024 * 1024
+SNIFF_SIZE = 8192
+
+# magic, stride, file generation, scanned size, newline count, start of last line
+HEADER = struct.Struct("<8sIQQQQ")
+MAGIC = b"LIDX0002"
+
+
+def is_text_file(path):
+    """Treat a file as text unless its first few KB contain a NUL byte"""
+    with open(path, "rb") as f:
+        return b"\0" not in f.read(SNIFF_SIZE)
+
+
+def decode_line(line):
+    return line.rstrip(b"\r\n").decode("utf-8", errors="replace")
+
+
+def read_forward(
+    f, count, skip=0, max_line_bytes=MAX_LINE_BYTES, max_bytes=MAX_PREVIEW_BYTES
+):
+    """Read count lines from f's current position after skipping skip lines.
+
+    Lines longer than max_line_bytes are cut short, and reading stops once
+    max_bytes have been read. Returns (lines, truncated), truncated being the
+    positions in lines of the lines that were cut short.
+    """
+    lines = []
+    truncated = []
+    budget = max_bytes
+    while len(lines) < count and budget > 0:
+        want = min(max_line_bytes + 1, budget)
+        line = f.readline(want)
+        if not line:
+            break
+        budget -= len(line)
+        ended = line.endswith(b"\n") or len(line) < want
+        cut = not ended
+        # Skip the rest of an over-long line, as far as the budget allows
+        while not ended and budget > 0:
+            want = min(READ_BLOCK, budget)
+            rest = f.readline(want)
+            budget -= len(rest)
+            ended = rest.endswith(b"\n") or len(rest) < want
+
+        if skip:
+            skip -= 1
+        else:
+            if cut:
+                truncated.append(len(lines))
+            lines.append(decode_line(line[:max_line_bytes]))
+        if not ended:
+            break
+    return lines, truncated
+
+
+def read_head(path, count, max_line_bytes=MAX_LINE_BYTES, max_bytes=MAX_PREVIEW_BYTES):
+    with open(path, "rb") as f:
+        return read_forward(f, count, 0, max_line_bytes, max_bytes)
+
+
+def read_tail(path, count, max_line_bytes=MAX_LINE_BYTES, max_bytes=MAX_PREVIEW_BYTES):
+    """The last count lines, reading back at most max_bytes. Returns
+    (lines, truncated) like read_forward."""
+    if count <= 0:
+        return [], []
+
+    blocks = []
+    newlines = 0
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        budget = max_bytes
+        # Read backwards until we have more newlines than lines asked for, so
+        # the first line we keep is known to be complete
+        while pos > 0 and newlines <= count and budget > 0:
+            step = min(READ_BLOCK, pos, budget)
+            pos -= step
+            budget -= step
+            f.seek(pos)
+            blocks.append(f.read(step))
+            newlines += blocks[-1].count(b"\n")
+
+    lines = b"".join(reversed(blocks)).split(b"\n")
+    if lines and lines[-1] == b"":
+        lines.pop()
+    # Without a newline before it, the first line's start wasn't reached
+    first_complete = pos == 0 or len(lines) > count
+    lines = lines[-count:]
+
+    truncated = [
+        i
+        for i, line in enumerate(lines)
+        if len(line) > max_line_bytes or (i == 0 and not first_complete)
+    ]
+    return [decode_line(line[:max_line_bytes]) for line in lines], truncated
+
+
+class LineIndex:
+    def __init__(self, path, index_path=None, stride=DEFAULT_STRIDE, generation=0):
+        self.path = path
+        self.index_path = index_path
+        self.stride = stride
+        # Bumped each time the file is replaced; an index saved for another
+        # generation of the file is ignored
+        self.generation = generation
+        self.stale = False
+        # Guards the published scan state below. Scans run without it, since
+        # a background job may back off for a long time in the middle of one.
+        self.lock = threading.Lock()
+        self.epoch = 0
+        self.reset()
+
+    def reset(self):
+        # Scans started before a reset must not publish their results
+        self.epoch += 1
+        # offsets[i] is the byte offset where line i * stride starts; the array
+        # is replaced rather than modified, so readers can use it unlocked
+        self.offsets = array.array("Q", [0])
+        self.scanned_size = 0
+        self.newlines = 0
+        self.last_line_start = 0
+
+    @property
+    def total_lines(self):
+        partial = 1 if self.scanned_size > self.last_line_start else 0
+        return self.newlines + partial
+
+    def load(self):
+        if not self.index_path or not os.path.exists(self.index_path):
+            return False
+
+        with open(self.index_path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) != HEADER.size:
+                return False
+            (
+                magic,
+                stride,
+                generation,
+                scanned_size,
+                newlines,
+                last_line_start,
+            ) = HEADER.unpack(header)
+            if (
+                magic != MAGIC
+                or stride != self.stride
+                or generation != self.generation
+            ):
+                return False
+            data = f.read()
+
+        # One offset for line 0 and one per stride newlines; anything else is
+        # a truncated or corrupt file
+        if len(data) != (1 + newlines // stride) * 8:
+            return False
+        offsets = array.array("Q")
+        offsets.frombytes(data)
+
+        self.offsets = offsets
+        self.scanned_size = scanned_size
+        self.newlines = newlines
+        self.last_line_start = last_line_start
+        return True
+
+    def save(self):
+        if not self.index_path or self.stale:
+            return
+
+        with self.lock:
+            header = HEADER.pack(
+                MAGIC,
+                self.stride,
+                self.generation,
+                self.scanned_size,
+                self.newlines,
+                self.last_line_start,
+            )
+            offsets = self.offsets
+
+        # Several worker processes may save the same index at once
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.index_path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                offsets.tofile(f)
+            os.replace(tmp_path, self.index_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def update(self, checkpoint=None):
+        """Bring the index up to date with the file, scanning only new bytes"""
+        with self.lock:
+            size = os.path.getsize(self.path)
+            if size < self.scanned_size or not self._prefix_unchanged():
+                self.reset()
+            state = (
+                self.epoch,
+                len(self.offsets),
+                self.scanned_size,
+                self.newlines,
+                self.last_line_start,
+            )
+        if size > state[2] and self._scan(size, state, checkpoint):
+            self.save()
+        return self
+
+    def _prefix_unchanged(self):
+        # Cheap sanity check that the file was appended to rather than replaced
+        if self.last_line_start == 0:
+            return True
+        with open(self.path, "rb") as f:
+            f.seek(self.last_line_start - 1)
+            return f.read(1) == b"\n"
+
+    def _publish(self, state, new_offsets, scanned_size, newlines, last_line_start):
+        epoch, base_length = state[:2]
+        with self.lock:
+            if epoch != self.epoch or scanned_size <= self.scanned_size:
+                return False
+            # Scans of the same bytes give the same offsets, so ours can
+            # replace anything published since we started
+            offsets = self.offsets[:base_length]
+            offsets.extend(new_offsets)
+            self.offsets = offsets
+            self.scanned_size = scanned_size
+            self.newlines = newlines
+            self.last_line_start = last_line_start
+            return True
+
+    def _scan(self, size, state, checkpoint=None):
+        """Scan from the state captured by update() up to size, publishing
+        after every chunk. Returns True if anything was published."""
+        epoch, _, pos, newlines, last_line_start = state
+        stride = self.stride
+        new_offsets = array.array("Q")
+        published = False
+        with open(self.path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm:
+            while pos < size:
+                with self.lock:
+                    if epoch != self.epoch or self.scanned_size >= size:
+                        # Reset, or another scan already got this far
+                        break
+                if checkpoint is not None:
+                    checkpoint()
+
+                end = min(pos + SCAN_CHUNK, size)
+                parts = mm[pos:end].split(b"\n")
+                found = len(parts) - 1
+                if found:
+                    # lengths[k] is the length of the chunk up to newline k,
+                    # not counting the k newlines before it
+                    lengths = list(itertools.accumulate(map(len, parts[:-1])))
+                    first = (stride - newlines % stride) - 1
+                    for k in range(first, found, stride):
+                        new_offsets.append(pos + lengths[k] + k + 1)
+                    newlines += found
+                    last_line_start = pos + lengths[-1] + found
+                pos = end
+                published |= self._publish(
+                    state, new_offsets, pos, newlines, last_line_start
+                )
+        return published
+
+    def read_lines(
+        self, start, count, max_line_bytes=MAX_LINE_BYTES, max_bytes=MAX_PREVIEW_BYTES
+    ):
+        """Lines start .. start + count - 1 (0-based), as (lines, truncated)
+        like read_forward"""
+        offsets = self.offsets
+        checkpoint = min(start // self.stride, len(offsets) - 1)
+        with open(self.path, "rb") as f:
+            f.seek(offsets[checkpoint])
+            return read_forward(
+                f, count, start - checkpoint * self.stride, max_line_bytes, max_bytes
+            )
+
+
+class LineIndexStore:
+    """Line indexes for the files in a folder, cached in memory and on disk"""
+
+    def __init__(self, folder, stride=DEFAULT_STRIDE):
+        self.folder = folder
+        self.stride = stride
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def index_path(self, filename):
+        return os.path.join(self.folder, filename + ".lidx")
+
+    def get(self, path, filename, checkpoint=None, generation=0):
+        with self._lock:
+            index = self._indexes.get(filename)
+            if index is not None and index.generation != generation:
+                # Another process replaced the file since we cached this
+                index.stale = True
+                index = None
+            if index is None:
+                index = LineIndex(
+                    path, self.index_path(filename), self.stride, generation
+                )
+                index.load()
+                self._indexes[filename] = index
+        return index.update(checkpoint)
+
+    def discard(self, filename):
+        with self._lock:
+            index = self._indexes.pop(filename, None)
+            if index is not None:
+                # A scan still running on the old file must not save over us
+                index.stale = True
+            index_path = self.index_path(filename)
+            if os.path.exists(index_path):
+                os.remove(index_path)
@@ -0,0 +1,392 @@
+// Tab functionality
+document.querySelectorAll('.tab').forEach(tab => {
+    tab.addEventListener('click', () => {
+        // Remove active class from all tabs and content
+        document.querySelectorAll('.tab').forEach(t => t.classList.remove('active'));
+        document.querySelectorAll('.tab-content').forEach(c => c.classList.remove('active'));
+
+        // Add active class to clicked tab and corresponding content
+        tab.classList.add('active');
+        document.getElementById(tab.dataset.tab + 'Tab').classList.add('active');
+    });
+});
+
+// File upload with progress bar
+document.getElementById('uploadForm').addEventListener('submit', function(e) {
+    e.preventDefault();
+
+    const fileInput = document.getElementById('fileInput');
+    const file = fileInput.files[0];
+
+    if (!file) {
+        showMessage('uploadMessage', 'Please select a file to upload', 'error');
+        return;
+    }
+
+    const formData = new FormData();
+    formData.append('file', file);
+
+    const xhr = new XMLHttpRequest();
+
+    // Setup progress event
+    xhr.upload.addEventListener('progress', (event) => {
+        if (event.lengthComputable) {
+            const percentComplete = Math.round((event.loaded / event.total) * 100);
+            document.getElementById('uploadProgressContainer').style.display = 'block';
+            document.getElementById('uploadProgressBar').style.width = percentComplete + '%';
+            document.getElementById('uploadProgressBar').textContent = percentComplete + '%';
+
+            // Calculate and display upload speed
+            const elapsedTime = (new Date().getTime() - uploadStartTime) / 1000; // seconds
+            if (elapsedTime > 0) {
+                const bytesPerSecond = event.loaded / elapsedTime;
+                const mbps = (bytesPerSecond / (1024 * 1024)).toFixed(2);
+                document.getElementById('uploadSpeed').textContent = `Current speed: ${mbps} MB/s`;
+            }
+        }
+    });
+
+    xhr.onreadystatechange = function() {
+        if (xhr.readyState === 4) {
+            if (xhr.status === 200) {
+                const response = JSON.parse(xhr.responseText);
+                if (response.success) {
+                    showMessage('uploadMessage', 'File uploaded successfully! ' + response.upload_speed, 'success');
+                    // Refresh the file list to show the new file
+                    loadFiles();
+                } else {
+                    showMessage('uploadMessage', 'Upload failed: ' + response.message, 'error');
+                }
+            } else {
+                showMessage('uploadMessage', 'Upload failed. Server error.', 'error');
+            }
+        }
+    };
+
+    // Start upload
+    const uploadStartTime = new Date().getTime();
+    xhr.open('POST', '/upload', true);
+    xhr.send(formData);
+});
+
+// Format a byte count the same way for every file
+function formatSize(sizeBytes) {
+    if (sizeBytes < 1024) {
+        return sizeBytes + ' B';
+    } else if (sizeBytes < 1024 * 1024) {
+        return (sizeBytes / 1024).toFixed(1) + ' KB';
+    }
+    return (sizeBytes / (1024 * 1024)).toFixed(1) + ' MB';
+}
+
+// Fetch the file listing and render it. Entries are [name, size_bytes, downloads]
+function loadFiles() {
+    fetch('/api/files')
+        .then(response => response.json())
+        .then(data => renderFiles(data.files))
+        .catch(error => {
+            document.getElementById('filesList').innerHTML =
+                '<div class="empty-list">Failed to load files</div>';
+        });
+}
+
+function renderFiles(files) {
+    const filesList = document.getElementById('filesList');
+    filesList.innerHTML = '';
+
+    if (files.length === 0) {
+        filesList.innerHTML = '<div class="empty-list">No files available</div>';
+        return;
+    }
+
+    files.forEach(([name, sizeBytes, downloads]) => {
+        const item = document.createElement('div');
+        item.className = 'file-item';
+
+        const fileName = document.createElement('div');
+        fileName.className = 'file-name';
+        fileName.textContent = name;
+
+        const fileInfo = document.createElement('div');
+        fileInfo.className = 'file-info';
+        fileInfo.textContent = formatSize(sizeBytes) + ' | ' + downloads + ' downloads';
+
+        const downloadBtn = document.createElement('a');
+        downloadBtn.href = '#';
+        downloadBtn.className = 'download-btn';
+        downloadBtn.textContent = 'Download';
+
+        const deleteBtn = document.createElement('a');
+        deleteBtn.href = '#';
+        deleteBtn.className = 'delete-btn';
+        deleteBtn.textContent = 'Delete';
+
+        const progressContainer = document.createElement('div');
+        progressContainer.className = 'progress-container download-progress';
+        progressContainer.style.display = 'none';
+        progressContainer.innerHTML = '<div class="progress-bar">0%</div>';
+
+        downloadBtn.addEventListener('click', function(e) {
+            e.preventDefault();
+            startDownload(name, sizeBytes, progressContainer);
+        });
+
+        deleteBtn.addEventListener('click', function(e) {
+            e.preventDefault();
+            if (confirm('Are you sure you want to delete this file?')) {
+                fetch('/delete/' + encodeURIComponent(name)).then(() => loadFiles());
+            }
+        });
+
+        item.append(fileName, fileInfo, downloadBtn, deleteBtn);
+        filesList.append(item, progressContainer);
+    });
+}
+
+// File download with progress bar
+function startDownload(filename, fileSize, progressContainer) {
+    const progressBar = progressContainer.querySelector('.progress-bar');
+
+    // Show progress container
+    progressContainer.style.display = 'block';
+    progressBar.style.width = '0%';
+    progressBar.textContent = '0%';
+
+    // Create a hidden iframe to avoid page navigation
+    const iframe = document.createElement('iframe');
+    iframe.style.display = 'none';
+    document.body.appendChild(iframe);
+
+    // Track download progress
+    const downloadStartTime = new Date().getTime();
+
+    // Poll download progress
+    const progressInterval = setInterval(() => {
+        // Simulate progress since browser doesn't provide direct download progress
+        // This is a rough estimation
+        const elapsedMs = new Date().getTime() - downloadStartTime;
+        const estimatedProgress = Math.min(99, Math.round((elapsedMs / (fileSize / 50000)) * 100));
+
+        progressBar.style.width = estimatedProgress + '%';
+        progressBar.textContent = estimatedProgress + '%';
+
+        // If we estimate it's likely finished
+        if (estimatedProgress >= 99) {
+            clearInterval(progressInterval);
+            setTimeout(() => {
+                progressBar.style.width = '100%';
+                progressBar.textContent = '100%';
+
+                // Hide progress bar after a short delay
+                setTimeout(() => {
+                    progressContainer.style.display = 'none';
+                }, 1000);
+            }, 500);
+        }
+    }, 100);
+
+    // Start the download
+    iframe.src = '/download/' + encodeURIComponent(filename);
+}
+
+
+// Download speed test
+function startDownloadTest(sizeMb) {
+    // Show progress bar
+    const progressContainer = document.getElementById('downloadTestProgress');
+    const progressBar = document.getElementById('downloadTestProgressBar');
+    progressContainer.style.display = 'block';
+    progressBar.style.width = '0%';
+    progressBar.textContent = 'Generating test file...';
+
+    // First request a test file of the specified size
+    fetch('/generate_speedtest_file/' + sizeMb)
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                // Now download the file and measure speed
+                const filename = data.filename;
+                const fileSize = data.size_mb * 1024 * 1024; // Convert MB to bytes
+
+                const downloadStartTime = new Date().getTime();
+                progressBar.textContent = 'Downloading...';
+
+                // Create XMLHttpRequest to track download progress
+                const xhr = new XMLHttpRequest();
+                xhr.open('GET', '/speedtest/download/' + encodeURIComponent(filename), true);
+                xhr.responseType = 'blob';
+
+                xhr.addEventListener('progress', (event) => {
+                    if (event.lengthComputable) {
+                        const percentComplete = Math.round((event.loaded / event.total) * 100);
+                        progressBar.style.width = percentComplete + '%';
+                        progressBar.textContent = percentComplete + '%';
+
+                        // Calculate current speed
+                        const elapsedSeconds = (new Date().getTime() - downloadStartTime) / 1000;
+                        if (elapsedSeconds > 0) {
+                            const mbps = (event.loaded / elapsedSeconds / 1024 / 1024).toFixed(2);
+                            document.getElementById('downloadTestResult').style.display = 'block';
+                            document.getElementById('downloadTestResult').innerHTML =
+                                `Current Download Speed: <strong>${mbps} MB/s</strong><br>` +
+                                `Downloaded: ${Math.round(event.loaded/1024/1024)}/${Math.round(event.total/1024/1024)} MB`;
+                        }
+                    }
+                });
+
+                xhr.addEventListener('load', () => {
+                    if (xhr.status === 200) {
+                        const downloadTime = (new Date().getTime() - downloadStartTime) / 1000;
+                        const speed = fileSize / downloadTime / 1024 / 1024;
+
+                        progressBar.style.width = '100%';
+                        progressBar.textContent = '100%';
+
+                        document.getElementById('downloadTestResult').style.display = 'block';
+                        document.getElementById('downloadTestResult').innerHTML =
+                            `Download Speed: <strong>${speed.toFixed(2)} MB/s</strong><br>` +
+                            `Downloaded: ${sizeMb} MB in ${downloadTime.toFixed(2)} seconds`;
+
+                        // Clean up the test file
+                        fetch('/clean_speedtest_files');
+                    }
+                });
+
+                xhr.addEventListener('error', () => {
+                    document.getElementById('downloadTestResult').style.display = 'block';
+                    document.getElementById('downloadTestResult').innerHTML = 'Download test failed';
+                    progressContainer.style.display = 'none';
+                });
+
+                xhr.send();
+            } else {
+                document.getElementById('downloadTestResult').style.display = 'block';
+                document.getElementById('downloadTestResult').innerHTML = 'Failed to generate test file: ' + data.message;
+                progressContainer.style.display = 'none';
+            }
+        })
+        .catch(error => {
+            document.getElementById('downloadTestResult').style.display = 'block';
+            document.getElementById('downloadTestResult').innerHTML = 'Error: ' + error;
+            progressContainer.style.display = 'none';
+        });
+}
+
+// Upload speed test
+function startUploadTest(sizeMb) {
+    // Show progress bar
+    const progressContainer = document.getElementById('uploadTestProgress');
+    const progressBar = document.getElementById('uploadTestProgressBar');
+    progressContainer.style.display = 'block';
+    progressBar.style.width = '0%';
+    progressBar.textContent = 'Generating test file...';
+
+    document.getElementById('uploadTestResult').style.display = 'block';
+    document.getElementById('uploadTestResult').innerHTML = 'Preparing test data...';
+
+    // Generate random data for upload
+    const byteSize = sizeMb * 1024 * 1024;
+    const chunkSize = 1024 * 1024; // 1MB chunks
+    const totalChunks = Math.ceil(byteSize / chunkSize);
+    let generatedSize = 0;
+    const chunks = [];
+
+    // Generate data in smaller chunks to avoid browser memory issues
+    function generateNextChunk() {
+        if (generatedSize >= byteSize) {
+            performUploadTest();
+            return;
+        }
+
+        const currentChunkSize = Math.min(chunkSize, byteSize - generatedSize);
+        const chunk = new Uint8Array(currentChunkSize);
+
+        // Fill with random data
+        window.crypto.getRandomValues(chunk);
+        chunks.push(chunk);
+
+        generatedSize += currentChunkSize;
+        const percentDone = Math.round((generatedSize / byteSize) * 100);
+
+        progressBar.style.width = percentDone + '%';
+        progressBar.textContent = 'Preparing: ' + percentDone + '%';
+
+        // Continue generating data in the next tick to avoid UI freezing
+        setTimeout(generateNextChunk, 0);
+    }
+
+    function performUploadTest() {
+        // Create a file from the generated chunks
+        const blob = new Blob(chunks);
+        const testFile = new File([blob], 'speedtest_upload.bin', { type: 'application/octet-stream' });
+
+        // Prepare form data
+        const formData = new FormData();
+        formData.append('file', testFile);
+        formData.append('file_size', byteSize);
+        formData.append('start_time', new Date().getTime() / 1000);
+
+        const xhr = new XMLHttpRequest();
+
+        // Setup progress event
+        xhr.upload.addEventListener('progress', (event) => {
+            if (event.lengthComputable) {
+                const percentComplete = Math.round((event.loaded / event.total) * 100);
+                progressBar.style.width = percentComplete + '%';
+                progressBar.textContent = percentComplete + '%';
+
+                // Calculate current speed
+                const elapsedSeconds = (new Date().getTime() / 1000) - parseFloat(formData.get('start_time'));
+                if (elapsedSeconds > 0) {
+                    const mbps = (event.loaded / elapsedSeconds / 1024 / 1024).toFixed(2);
+                    document.getElementById('uploadTestResult').innerHTML =
+                        `Current Upload Speed: <strong>${mbps} MB/s</strong><br>` +
+                        `Uploaded: ${Math.round(event.loaded/1024/1024)}/${Math.round(event.total/1024/1024)} MB`;
+                }
+            }
+        });
+
+        xhr.onreadystatechange = function() {
+            if (xhr.readyState === 4) {
+                if (xhr.status === 200) {
+                    const response = JSON.parse(xhr.responseText);
+                    if (response.success) {
+                        document.getElementById('uploadTestResult').innerHTML =
+                            `Upload Speed: <strong>${response.upload_speed_formatted}</strong><br>` +
+                            `Uploaded: ${sizeMb} MB in ${response.duration}`;
+                    } else {
+                        document.getElementById('uploadTestResult').innerHTML = 'Upload test failed: ' + response.message;
+                    }
+                } else {
+                    document.getElementById('uploadTestResult').innerHTML = 'Upload test failed. Server error.';
+                }
+            }
+        };
+
+        // Start upload
+        xhr.open('POST', '/speedtest/upload', true);
+        xhr.send(formData);
+    }
+
+    // Start generating data
+    generateNextChunk();
+}
+
+// Helper to show messages
+function showMessage(elementId, message, type) {
+    const messageElement = document.getElementById(elementId);
+    messageElement.textContent = message;
+    messageElement.className = 'message ' + type;
+    messageElement.style.display = 'block';
+
+    // Auto-hide after 5 seconds
+    setTimeout(() => {
+        messageElement.style.display = 'none';
+    }, 5000);
+}
+
+// Global upload start time
+let uploadStartTime = 0;
+
+// Initial file listing
+loadFiles();
@@ -0,0 +1,249 @@
+"""Shared state for running the app in several worker processes.
+
+Download counts, checksums and a per-file generation number live in one SQLite
+database in WAL mode, so any number of processes can read it concurrently
+while writes are serialised by SQLite's own file locking. The generation of a
+file is bumped whenever it is uploaded or deleted; processes compare it with
+what they have cached to notice that another worker changed the file.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    filename TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    filename TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS generations (
+    filename TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cluster_nodes (
+    url TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires REAL NOT NULL,
+    rerun INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class SharedStore:
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self.db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL only syncs at checkpoints, which keeps
+        # per-download writes cheap without risking corruption
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @property
+    def db(self):
+        # One connection per thread, and never reuse one across a fork
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.db = self._connect()
+            local.pid = os.getpid()
+        return local.db
+
+    @contextmanager
+    def transaction(self):
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def migrate_json(self, stats_file, hashes_file):
+        """Import the JSON files older versions kept, then move them aside"""
+        stats = self._take_json(stats_file)
+        hashes = self._take_json(hashes_file)
+        if not stats and not hashes:
+            return
+
+        with self.transaction() as db:
+            db.executemany(
+                "INSERT OR IGNORE INTO downloads (filename, count) VALUES (?, ?)",
+                stats.items(),
+            )
+            db.executemany(
+                "INSERT OR IGNORE INTO hashes (filename, sha256, size, mtime)"
+                " VALUES (?, ?, ?, ?)",
+                [
+                    (name, info["sha256"], info["size"], info["mtime"])
+                    for name, info in hashes.items()
+                ],
+            )
+
+    def _take_json(self, path):
+        # Several workers may start at once; only one of them gets the file
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            os.replace(path, path + ".migrated")
+        except FileNotFoundError:
+            return {}
+        return data
+
+    # Download counts
+
+    def download_stats(self):
+        return dict(self.db.execute("SELECT filename, count FROM downloads"))
+
+    def add_file(self, filename):
+        self.db.execute(
+            "INSERT OR IGNORE INTO downloads (filename, count) VALUES (?, 0)",
+            (filename,),
+        )
+
+    def increment_downloads(self, filename, count=1):
+        self.db.execute(
+            "INSERT INTO downloads (filename, count) VALUES (?, ?)"
+            " ON CONFLICT (filename) DO UPDATE SET count = count + excluded.count",
+            (filename, count),
+        )
+
+    def take_downloads(self, filename):
+        """Return a file's download count and reset it to zero, atomically,
+        so a count handed over to another node is only handed over once"""
+        with self.transaction() as db:
+            row = db.execute(
+                "SELECT count FROM downloads WHERE filename = ?", (filename,)
+            ).fetchone()
+            if not row or not row[0]:
+                return 0
+            db.execute("UPDATE downloads SET count = 0 WHERE filename = ?", (filename,))
+            return row[0]
+
+    # Checksums
+
+    def file_hashes(self):
+        rows = self.db.execute("SELECT filename, sha256, size, mtime FROM hashes")
+        return {
+            name: {"sha256": sha256, "size": size, "mtime": mtime}
+            for name, sha256, size, mtime in rows
+        }
+
+    def file_hash(self, filename):
+        row = self.db.execute(
+            "SELECT sha256, size, mtime FROM hashes WHERE filename = ?", (filename,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"sha256": row[0], "size": row[1], "mtime": row[2]}
+
+    def set_hash(self, filename, sha256, size, mtime):
+        self.db.execute(
+            "INSERT OR REPLACE INTO hashes (filename, sha256, size, mtime)"
+            " VALUES (?, ?, ?, ?)",
+            (filename, sha256, size, mtime),
+        )
+
+    # Cross-worker invalidation
+
+    def generation(self, filename):
+        row = self.db.execute(
+            "SELECT generation FROM generations WHERE filename = ?", (filename,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump_generation(self, filename):
+        with self.transaction() as db:
+            return self._bump_generation(db, filename)
+
+    def _bump_generation(self, db, filename):
+        db.execute(
+            "INSERT INTO generations (filename, generation) VALUES (?, 1)"
+            " ON CONFLICT (filename) DO UPDATE SET generation = generation + 1",
+            (filename,),
+        )
+        return db.execute(
+            "SELECT generation FROM generations WHERE filename = ?", (filename,)
+        ).fetchone()[0]
+
+    def remove_file(self, filename):
+        """Forget everything about a deleted file and invalidate caches of it"""
+        with self.transaction() as db:
+            db.execute("DELETE FROM downloads WHERE filename = ?", (filename,))
+            db.execute("DELETE FROM hashes WHERE filename = ?", (filename,))
+            return self._bump_generation(db, filename)
+
+    # Cluster membership
+
+    def cluster_nodes(self):
+        return [url for (url,) in self.db.execute("SELECT url FROM cluster_nodes")]
+
+    def add_cluster_node(self, url):
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO cluster_nodes (url) VALUES (?)", (url,)
+        )
+        return cursor.rowcount == 1
+
+    # Leases: work that only one worker process may do at a time
+
+    def acquire_lease(self, name, holder, ttl):
+        """Take or renew the named lease for ttl seconds; False if another
+        live holder has it"""
+        now = time.time()
+        with self.transaction() as db:
+            row = db.execute(
+                "SELECT holder, expires FROM leases WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                db.execute(
+                    "INSERT OR REPLACE INTO leases (name, holder, expires, rerun)"
+                    " VALUES (?, ?, ?, 0)",
+                    (name, holder, now + ttl),
+                )
+                return True
+            if row[0] == holder:
+                db.execute(
+                    "UPDATE leases SET expires = ? WHERE name = ?", (now + ttl, name)
+                )
+                return True
+            return False
+
+    def request_rerun(self, name):
+        """Ask whoever holds the lease, if anyone, to run once more"""
+        self.db.execute("UPDATE leases SET rerun = 1 WHERE name = ?", (name,))
+
+    def finish_lease(self, name, holder):
+        """Release a lease, unless a rerun was asked for while it was held:
+        then keep it and return True so the holder goes round again"""
+        with self.transaction() as db:
+            row = db.execute(
+                "SELECT rerun FROM leases WHERE name = ? AND holder = ?", (name, holder)
+            ).fetchone()
+            if row and row[0]:
+                db.execute("UPDATE leases SET rerun = 0 WHERE name = ?", (name,))
+                return True
+            db.execute(
+                "DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder)
+            )
+            return False
+
+    def release_lease(self, name, holder):
+        self.db.execute(
+            "DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder)
+        )
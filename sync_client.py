@@ -0,0 +1,434 @@
+"""Command-line client that mirrors a local directory to the server and back.
+
+    python sync_client.py push ./photos http://192.168.1.10:5000
+    python sync_client.py pull ./photos http://192.168.1.10:5000 --jobs 8
+
+The server's manifest (name, size, mtime, SHA-256) is compared with the local
+files, and only files that differ are transferred. Local checksums are cached
+in .filesync-cache.json in the synced directory, keyed by size and mtime, so
+unchanged files are never re-read. Transfers run in parallel, each worker
+thread keeping its own keep-alive connection to the server.
+
+The server stores files in one flat folder, so a file in a subdirectory is
+stored as e.g. "docs__notes.txt" and restored to docs/notes.txt on pull (a
+top-level file really named "docs__notes.txt" comes back the same way).
+Names the server would not accept as-is (see SAFE_NAME) are skipped, as are
+local files whose server names collide and server names that would land
+outside the synced directory.
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_FILE = ".filesync-cache.json"
+PART_SUFFIX = ".filesync-part"  # Downloads in progress
+SEPARATOR = "__"
+CHUNK_SIZE = 1024 * 1024
+
+# What the server's secure_filename() leaves untouched
+SAFE_NAME = re.compile(r"^[A-Za-z0-9-][A-Za-z0-9_.-]*(?<![._])$")
+
+
+class SyncError(Exception):
+    pass
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def same_mtime(a, b):
+    # Filesystems and os.utime() don't all keep full float precision
+    return abs(a - b) < 0.001
+
+
+class ConnectionPool:
+    """One persistent HTTP connection per thread"""
+
+    def __init__(self, base_url, timeout=60):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.scheme = parsed.scheme
+        self.netloc = parsed.netloc
+        self.prefix = parsed.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self, netloc=None):
+        netloc = netloc or self.netloc
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        if netloc not in connections:
+            cls = (
+                http.client.HTTPSConnection
+                if self.scheme == "https"
+                else http.client.HTTPConnection
+            )
+            connections[netloc] = cls(netloc, timeout=self.timeout, blocksize=CHUNK_SIZE)
+        return connections[netloc]
+
+    def request(self, method, path, body=None, headers=None, netloc=None):
+        """Send a request and return the response. The caller must read it
+        completely before the thread's next request."""
+        url = path if netloc else self.prefix + path
+        for attempt in range(2):
+            conn = self._connection(netloc)
+            try:
+                if body is not None and hasattr(body, "seek"):
+                    body.seek(0)
+                conn.request(method, url, body=body, headers=headers or {})
+                return conn.getresponse()
+            except (http.client.HTTPException, ConnectionError):
+                # The server may have closed an idle keep-alive connection
+                conn.close()
+                if attempt:
+                    raise
+
+    def get_json(self, path):
+        response = self.request("GET", path)
+        body = response.read()
+        if response.status != 200:
+            raise SyncError(f"GET {path}: {response.status}")
+        return json.loads(body)
+
+
+class Syncer:
+    def __init__(self, local_dir, server, jobs=4, delete=False, dry_run=False):
+        self.local_dir = os.path.abspath(local_dir)
+        self.pool = ConnectionPool(server)
+        self.jobs = jobs
+        self.delete = delete
+        self.dry_run = dry_run
+        self.cache_path = os.path.join(self.local_dir, CACHE_FILE)
+        self.cache = {}
+        self.bytes_transferred = 0
+        self.files_transferred = 0
+        # Server names left alone because local files collide on them
+        self.conflicts = set()
+        self._lock = threading.Lock()
+
+    # Local state
+
+    def load_cache(self):
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path, "r") as f:
+                self.cache = json.load(f)
+
+    def save_cache(self):
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.cache, f, separators=(",", ":"))
+        os.replace(tmp_path, self.cache_path)
+
+    def scan_local(self):
+        """Map server name -> (relative path, size, mtime, sha256)"""
+        found = {}
+        to_hash = []
+        for root, dirs, filenames in os.walk(self.local_dir):
+            dirs.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                rel_path = os.path.relpath(path, self.local_dir)
+                if rel_path == CACHE_FILE or rel_path == CACHE_FILE + ".tmp":
+                    continue
+                if filename.endswith(PART_SUFFIX):
+                    # Left behind by an interrupted pull
+                    continue
+
+                name = SEPARATOR.join(rel_path.split(os.sep))
+                if not SAFE_NAME.match(name):
+                    print(f"skipping {rel_path}: name not accepted by the server")
+                    continue
+                if name in found or name in self.conflicts:
+                    # e.g. "a__b.txt" next to "a/b.txt"; syncing either
+                    # would overwrite the other on the next pull
+                    clashing = [rel_path]
+                    if name in found:
+                        clashing.insert(0, found.pop(name)[0])
+                    for clash in clashing:
+                        print(f"skipping {clash}: stored on the server as {name}")
+                    self.conflicts.add(name)
+                    continue
+
+                stat = os.stat(path)
+                cached = self.cache.get(rel_path)
+                if (
+                    cached
+                    and cached[0] == stat.st_size
+                    and cached[1] == stat.st_mtime_ns
+                ):
+                    sha256 = cached[2]
+                else:
+                    sha256 = None
+                    to_hash.append((rel_path, path, stat))
+                found[name] = [rel_path, stat.st_size, stat.st_mtime, sha256]
+
+        # Only new or modified files are read, several at a time
+        to_hash = [
+            item
+            for item in to_hash
+            if SEPARATOR.join(item[0].split(os.sep)) not in self.conflicts
+        ]
+        if to_hash:
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                digests = pool.map(lambda item: file_sha256(item[1]), to_hash)
+                for (rel_path, _, stat), sha256 in zip(to_hash, digests):
+                    self.cache[rel_path] = [stat.st_size, stat.st_mtime_ns, sha256]
+                    name = SEPARATOR.join(rel_path.split(os.sep))
+                    found[name][3] = sha256
+
+        # Forget files that no longer exist
+        live = {entry[0] for entry in found.values()}
+        for rel_path in list(self.cache):
+            if rel_path not in live:
+                del self.cache[rel_path]
+        return found
+
+    def local_path(self, name):
+        """Where a file from the server goes locally, or None if its name
+        is unsafe or would put it outside the synced directory"""
+        parts = name.split(SEPARATOR)
+        if not SAFE_NAME.match(name) or any(part in ("", ".", "..") for part in parts):
+            return None
+        root = os.path.realpath(self.local_dir)
+        path = os.path.realpath(os.path.join(root, *parts))
+        if os.path.commonpath([root, path]) != root or path == root:
+            return None
+        return path
+
+    def remote_manifest(self):
+        """Map server name -> (size, mtime, sha256)"""
+        manifest = self.pool.get_json("/api/manifest")
+        return {name: (size, mtime, sha256) for name, size, mtime, sha256 in manifest["files"]}
+
+    @staticmethod
+    def differs(local, remote):
+        _, size, mtime, sha256 = local
+        remote_size, remote_mtime, remote_sha256 = remote
+        if size != remote_size:
+            return True
+        if remote_sha256 is not None:
+            return sha256 != remote_sha256
+        # The server hasn't hashed it yet; fall back to the mtime we sent
+        return not same_mtime(mtime, remote_mtime)
+
+    # Transfers
+
+    def _record(self, size):
+        with self._lock:
+            self.bytes_transferred += size
+            self.files_transferred += 1
+
+    def upload(self, name, local):
+        rel_path, size, mtime, _ = local
+        path = os.path.join(self.local_dir, rel_path)
+        with open(path, "rb") as f:
+            response = self.pool.request(
+                "PUT",
+                "/api/files/" + urllib.parse.quote(name),
+                body=f,
+                headers={
+                    "Content-Length": str(size),
+                    "Content-Type": "application/octet-stream",
+                    "X-File-Mtime": repr(mtime),
+                },
+            )
+            body = response.read()
+        if response.status != 200:
+            raise SyncError(f"upload of {rel_path} failed: {response.status} {body[:200]!r}")
+        self._record(size)
+
+    def download(self, name, remote):
+        size, mtime, expected_sha256 = remote
+        path = self.local_path(name)
+        if path is None:
+            raise SyncError(f"refusing to download {name}: unsafe name")
+        rel_path = os.path.join(*name.split(SEPARATOR))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        response = self.pool.request("GET", "/download/" + urllib.parse.quote(name))
+        if response.status in (301, 302, 303, 307, 308):
+            # In cluster mode the file may live on another node
+            response.read()
+            location = urllib.parse.urlsplit(response.getheader("Location"))
+            response = self.pool.request(
+                "GET",
+                urllib.parse.urlunsplit(("", "", location.path, location.query, "")),
+                netloc=location.netloc,
+            )
+        if response.status != 200:
+            response.read()
+            raise SyncError(f"download of {name} failed: {response.status}")
+
+        digest = hashlib.sha256()
+        tmp_path = path + PART_SUFFIX
+        try:
+            with open(tmp_path, "wb") as f:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+            if expected_sha256 is not None and digest.hexdigest() != expected_sha256:
+                raise SyncError(f"download of {name} failed: checksum mismatch")
+            os.utime(tmp_path, (mtime, mtime))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        stat = os.stat(path)
+        with self._lock:
+            self.cache[rel_path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self._record(stat.st_size)
+
+    def delete_remote(self, name):
+        response = self.pool.request("GET", "/delete/" + urllib.parse.quote(name))
+        body = response.read()
+        # The server redirects back to the file list once the file is gone
+        if response.status not in (200, 302, 303):
+            raise SyncError(f"delete of {name} failed: {response.status} {body[:200]!r}")
+
+    def delete_local(self, local):
+        os.remove(os.path.join(self.local_dir, local[0]))
+        self.cache.pop(local[0], None)
+
+    def run_parallel(self, func, items):
+        failures = []
+
+        def attempt(item):
+            try:
+                func(*item)
+            except (SyncError, OSError, http.client.HTTPException) as e:
+                with self._lock:
+                    failures.append(str(e))
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            list(pool.map(attempt, items))
+        return failures
+
+    # Commands
+
+    def conflict_failures(self):
+        return [
+            f"{name}: several local files map to this name"
+            for name in sorted(self.conflicts)
+        ]
+
+    def push(self):
+        local = self.scan_local()
+        remote = self.remote_manifest()
+        failures = self.conflict_failures()
+        changed = [
+            (name, entry)
+            for name, entry in local.items()
+            if name not in remote or self.differs(entry, remote[name])
+        ]
+        stale = []
+        if self.delete:
+            stale = [
+                name
+                for name in remote
+                if name not in local and name not in self.conflicts
+            ]
+
+        print(f"{len(local)} local files, {len(remote)} on server, {len(changed)} to upload")
+        if self.dry_run:
+            self.report_plan(changed, stale, "upload", "delete on server")
+            return failures
+
+        failures += self.run_parallel(self.upload, changed)
+        failures += self.run_parallel(self.delete_remote, [(name,) for name in stale])
+        return failures
+
+    def pull(self):
+        local = self.scan_local()
+        remote = self.remote_manifest()
+        failures = self.conflict_failures()
+        for name in list(remote):
+            if name in self.conflicts:
+                del remote[name]
+            elif self.local_path(name) is None:
+                print(f"skipping {name}: would be saved outside {self.local_dir}")
+                failures.append(f"{name}: unsafe name on the server")
+                del remote[name]
+        changed = [
+            (name, entry)
+            for name, entry in remote.items()
+            if name not in local or self.differs(local[name], entry)
+        ]
+        stale = [local[name] for name in local if name not in remote] if self.delete else []
+
+        print(f"{len(remote)} files on server, {len(local)} local, {len(changed)} to download")
+        if self.dry_run:
+            self.report_plan(
+                changed, [entry[0] for entry in stale], "download", "delete locally"
+            )
+            return failures
+
+        failures += self.run_parallel(self.download, changed)
+        for entry in stale:
+            self.delete_local(entry)
+        return failures
+
+    def report_plan(self, transfers, deletions, transfer_verb, delete_verb):
+        for name, _ in transfers:
+            print(f"would {transfer_verb} {name}")
+        for name in deletions:
+            print(f"would {delete_verb} {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mirror a local directory to a file sharing server and back"
+    )
+    parser.add_argument("command", choices=["push", "pull"])
+    parser.add_argument("local_dir", help="directory to sync")
+    parser.add_argument("server", help="server address, e.g. http://192.168.1.10:5000")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="parallel transfers")
+    parser.add_argument(
+        "--delete",
+        action="store_true",
+        help="also delete files that don't exist on the side being copied from",
+    )
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only show what would change")
+    args = parser.parse_args()
+
+    os.makedirs(args.local_dir, exist_ok=True)
+    syncer = Syncer(args.local_dir, args.server, args.jobs, args.delete, args.dry_run)
+    syncer.load_cache()
+
+    start = time.time()
+    try:
+        failures = syncer.push() if args.command == "push" else syncer.pull()
+    finally:
+        syncer.save_cache()
+    elapsed = time.time() - start
+
+    mb = syncer.bytes_transferred / 1024 / 1024
+    speed = mb / elapsed if elapsed > 0 else 0
+    print(
+        f"{syncer.files_transferred} files, {mb:.2f} MB in {elapsed:.2f} s"
+        f" ({speed:.2f} MB/s)"
+    )
+    for failure in failures:
+        print(f"error: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
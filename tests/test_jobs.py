@@ -0,0 +1,97 @@
+import threading
+import time
+
+from jobs import JobQueue
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def blocking_job(event):
+    """A job that runs, checkpointing, until event is set"""
+
+    def run(job):
+        while not event.is_set():
+            job.checkpoint()
+            time.sleep(0.01)
+        return "finished"
+
+    return run
+
+
+def occupy(queue):
+    """Keep the queue's only worker busy so later jobs stay queued"""
+    release = threading.Event()
+    job = queue.submit("block", "blocker", blocking_job(release))
+    wait_until(lambda: job.status == "running")
+    return release
+
+
+def test_duplicate_submit_returns_queued_job():
+    queue = JobQueue(workers=1)
+    release = occupy(queue)
+
+    first = queue.submit("hash", "a.txt", lambda job: 1)
+    second = queue.submit("hash", "a.txt", lambda job: 2)
+    other_kind = queue.submit("index", "a.txt", lambda job: 3)
+
+    assert second is first
+    assert other_kind is not first
+    release.set()
+    wait_until(lambda: first.status == "done" and other_kind.status == "done")
+    assert first.result == 1
+
+
+def test_submit_replaces_running_job():
+    queue = JobQueue(workers=2)
+    release = threading.Event()
+    running = queue.submit("hash", "a.txt", blocking_job(release))
+    wait_until(lambda: running.status == "running")
+
+    replacement = queue.submit("hash", "a.txt", lambda job: "new")
+
+    assert replacement is not running
+    wait_until(lambda: running.status == "cancelled")
+    wait_until(lambda: replacement.status == "done")
+    assert replacement.result == "new"
+
+
+def test_cancel_stops_queued_and_running_jobs():
+    queue = JobQueue(workers=1)
+    release = threading.Event()
+    running = queue.submit("hash", "a.txt", blocking_job(release))
+    wait_until(lambda: running.status == "running")
+    queued = queue.submit("index", "a.txt", lambda job: "ran")
+    unrelated = queue.submit("index", "b.txt", lambda job: "ran")
+
+    assert queue.cancel("a.txt") == 2
+
+    assert queued.status == "cancelled"
+    wait_until(lambda: running.status == "cancelled")
+    wait_until(lambda: unrelated.status == "done")
+    assert queued.result is None
+    assert queue.cancel("a.txt") == 0
+
+
+def test_history_keeps_only_recent_finished_jobs():
+    queue = JobQueue(workers=1, history=5)
+    jobs = [queue.submit("hash", f"{i}.txt", lambda job: None) for i in range(20)]
+    wait_until(lambda: all(job.status == "done" for job in jobs))
+    queue.submit("hash", "last.txt", lambda job: None)
+
+    kept = queue.list()
+    assert len(kept) <= 5
+    assert queue.get(jobs[0].id) is None
+    assert queue.list("last.txt")
+
+
+def test_back_off_is_capped_while_always_busy():
+    queue = JobQueue(workers=1, busy=lambda: True, poll_interval=0.01, max_defer=0.05)
+    release = threading.Event()
+    release.set()
+    job = queue.submit("hash", "a.txt", blocking_job(release))
+    wait_until(lambda: job.status == "done", timeout=2)
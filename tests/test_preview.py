@@ -0,0 +1,121 @@
+import random
+
+import pytest
+
+import preview
+from preview import LineIndex, read_head, read_tail
+
+
+def expected_offsets(data, stride):
+    """Offsets of every stride-th line, the slow and obvious way"""
+    starts = [0]
+    for i, byte in enumerate(data):
+        if byte == ord("\n"):
+            starts.append(i + 1)
+    return starts[::stride]
+
+
+def random_text(rng, lines):
+    return b"".join(
+        b"x" * rng.choice([0, 1, 3, 7, 40]) + b"\n" for _ in range(lines)
+    )
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Make scans cross many chunk boundaries on small files
+    monkeypatch.setattr(preview, "SCAN_CHUNK", 5)
+
+
+def check_index(index, data, stride):
+    assert list(index.offsets) == expected_offsets(data, stride)
+    assert index.newlines == data.count(b"\n")
+    lines = data.split(b"\n")
+    partial = 1 if lines[-1] else 0
+    assert index.total_lines == data.count(b"\n") + partial
+
+
+@pytest.mark.parametrize("stride", [1, 2, 3, 16])
+def test_offsets_match_naive_scan(tmp_path, small_chunks, stride):
+    rng = random.Random(stride)
+    for _ in range(20):
+        data = random_text(rng, rng.randint(0, 60)) + b"x" * rng.choice([0, 4])
+        path = tmp_path / "log.txt"
+        path.write_bytes(data)
+        index = LineIndex(str(path), stride=stride).update()
+        check_index(index, data, stride)
+
+
+def test_append_after_partial_line_resumes_scan(tmp_path, small_chunks):
+    path = tmp_path / "log.txt"
+    path.write_bytes(b"one\ntwo\nthr")
+    index = LineIndex(str(path), stride=2).update()
+    assert index.total_lines == 3
+
+    with open(path, "ab") as f:
+        f.write(b"ee\nfour\nfive\nsix")
+    index.update()
+
+    data = path.read_bytes()
+    check_index(index, data, 2)
+    assert index.read_lines(2, 4)[0] == ["three", "four", "five", "six"]
+
+
+def test_resume_matches_single_scan(tmp_path, small_chunks):
+    rng = random.Random(7)
+    data = random_text(rng, 200) + b"tail"
+    path = tmp_path / "log.txt"
+    index = LineIndex(str(path), stride=4)
+    written = 0
+    while written < len(data):
+        written = min(len(data), written + rng.randint(1, 50))
+        path.write_bytes(data[:written])
+        index.update()
+    check_index(index, data, 4)
+
+
+def test_saved_index_round_trips_and_rejects_bad_length(tmp_path):
+    path = tmp_path / "log.txt"
+    path.write_bytes(b"a\n" * 100)
+    index_path = str(tmp_path / "log.lidx")
+    LineIndex(str(path), index_path, stride=8).update()
+
+    loaded = LineIndex(str(path), index_path, stride=8)
+    assert loaded.load()
+    assert loaded.read_lines(50, 2)[0] == ["a", "a"]
+
+    with open(index_path, "ab") as f:
+        f.write(b"\0" * 8)
+    assert not LineIndex(str(path), index_path, stride=8).load()
+
+
+def test_read_lines_matches_split(tmp_path):
+    data = b"".join(b"line %d\n" % i for i in range(1000))
+    path = tmp_path / "log.txt"
+    path.write_bytes(data)
+    index = LineIndex(str(path), stride=16).update()
+    for start in (0, 15, 16, 17, 998, 999, 1000):
+        lines, truncated = index.read_lines(start, 3)
+        assert lines == [f"line {i}" for i in range(start, min(start + 3, 1000))]
+        assert truncated == []
+
+
+def test_long_lines_are_cut_and_marked(tmp_path):
+    path = tmp_path / "log.txt"
+    path.write_bytes(b"short\n" + b"z" * 100 + b"\nend\n")
+
+    assert read_head(str(path), 3, max_line_bytes=10) == (
+        ["short", "z" * 10, "end"],
+        [1],
+    )
+    assert read_tail(str(path), 2, max_line_bytes=10) == (["z" * 10, "end"], [0])
+
+
+def test_reads_stop_at_byte_budget(tmp_path):
+    path = tmp_path / "log.txt"
+    path.write_bytes(b"y" * 100000)
+
+    lines, truncated = read_tail(str(path), 1, max_line_bytes=50, max_bytes=1000)
+    assert lines == ["y" * 50] and truncated == [0]
+    lines, truncated = read_head(str(path), 5, max_line_bytes=50, max_bytes=1000)
+    assert lines == ["y" * 50] and truncated == [0]